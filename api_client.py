@@ -0,0 +1,65 @@
+import json
+import time
+from typing import Any, Callable, Optional, Union
+
+import httpx
+
+# 流式记录回调的最小间隔，避免每条记录都刷新一次界面
+FLUSH_INTERVAL = 0.2
+
+
+def analyze_via_api(base_url: str, input_data: Union[str, dict], progress_bar=None, status_text=None,
+                    batch_size: Optional[int] = None, max_tokens: int = 8192, use_cache: bool = True,
+                    on_records: Optional[Callable[[list], Any]] = None, compact: bool = True,
+                    timeout: float = 600.0) -> dict:
+    """通过分析服务的 /analyze/stream 接口分析区块，参数和返回值与 analyze_block 一致"""
+    block = json.loads(input_data) if isinstance(input_data, str) else input_data
+    payload = {
+        "block": block,
+        "mode": "llm",
+        "compact": compact,
+        "mev": False,
+        "use_cache": use_cache,
+        "batch_size": batch_size,
+        "max_tokens": max_tokens,
+    }
+    if status_text:
+        status_text.text("正在请求分析服务...")
+
+    pending = []
+    completed = 0
+    last_flush = time.perf_counter()
+
+    def flush():
+        nonlocal pending, last_flush
+        if pending and on_records:
+            on_records(pending)
+        pending = []
+        last_flush = time.perf_counter()
+        if status_text:
+            status_text.text(f"正在生成分析结果（已完成 {completed} 条记录）...")
+
+    url = base_url.rstrip("/") + "/analyze/stream"
+    with httpx.stream("POST", url, json=payload, timeout=timeout) as response:
+        if response.status_code != 200:
+            response.read()
+            raise ValueError(f"分析服务返回 {response.status_code}: {response.text}")
+        for line in response.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["event"] == "record":
+                pending.append(event["record"])
+                completed += 1
+                if time.perf_counter() - last_flush >= FLUSH_INTERVAL:
+                    flush()
+            elif event["event"] == "result":
+                flush()
+                if progress_bar:
+                    progress_bar.progress(1.0)
+                if status_text:
+                    status_text.text("命中缓存！" if event.get("cached") else "分析完成！")
+                return event["result"]
+            elif event["event"] == "error":
+                raise ValueError(f"分析服务出错: {event['error']}")
+    raise ValueError("分析服务没有返回结果")
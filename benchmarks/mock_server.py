@@ -0,0 +1,203 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ledger import build_ledger
+
+CHARS_PER_TOKEN = 3
+
+
+def compact_reply(payload: dict) -> dict:
+    """按紧凑格式给出正确答案"""
+    addresses = {}
+    for tx_index, logs in payload.get("x") or []:
+        for log_index, (sender, receiver, value, token) in enumerate(logs):
+            for address, side, peer in ((sender, "s", receiver), (receiver, "r", sender)):
+                entry = addresses.setdefault(str(address), {}).setdefault(str(token), {"s": [], "r": []})
+                entry[side].append([tx_index, log_index, peer, value])
+    return {"addresses": addresses}
+
+
+def build_reply(messages: list) -> str:
+    """模拟一个总是答对的模型：根据用户消息生成完整的分析结果"""
+    content = messages[-1].get("content") if messages else ""
+    try:
+        payload = json.loads(content)
+    except (TypeError, json.JSONDecodeError):
+        return "{}"
+    if isinstance(payload, dict) and "x" in payload:
+        return json.dumps(compact_reply(payload), separators=(",", ":"))
+    return json.dumps(build_ledger(payload), separators=(",", ":"))
+
+
+class MockConfig:
+    """流式响应的时序和错误注入参数"""
+
+    def __init__(self, ttft: float = 0.2, tokens_per_sec: float = 200.0, chunk_chars: int = 12,
+                 error_rate: float = 0.0, error_status: int = 429, seed: int = None):
+        self.ttft = ttft
+        self.tokens_per_sec = tokens_per_sec
+        self.chunk_chars = chunk_chars
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: MockConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, body) -> None:
+        data = body if isinstance(body, str) else json.dumps(body)
+        chunk = f"data: {data}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        # 子进程模式下供基准测试读取请求计数
+        if self.path.rstrip("/") != "/stats":
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        with self.config.lock:
+            stats = {"requests": self.config.requests, "errors": self.config.errors}
+        self._send_json(200, stats)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        config = self.config
+
+        with config.lock:
+            config.requests += 1
+            fail = config.rng.random() < config.error_rate
+            if fail:
+                config.errors += 1
+        if fail:
+            self._send_json(config.error_status, {"error": {"message": "injected error", "type": "mock"}})
+            return
+
+        messages = request.get("messages") or []
+        reply = build_reply(messages)
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // CHARS_PER_TOKEN + 1
+        completion_tokens = len(reply) // CHARS_PER_TOKEN + 1
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        base = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": request.get("model", "mock")}
+        time.sleep(config.ttft)
+        step = max(1, config.chunk_chars)
+        delay = step / CHARS_PER_TOKEN / config.tokens_per_sec if config.tokens_per_sec > 0 else 0
+        started = time.perf_counter()
+        for sent, i in enumerate(range(0, len(reply), step), 1):
+            self._send_event({**base, "choices": [
+                {"index": 0, "delta": {"content": reply[i:i + step]}, "finish_reason": None}
+            ]})
+            # 按累计耗时对齐速率，避免逐块 sleep 的误差累积
+            remaining = started + sent * delay - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+        self._send_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._send_event({**base, "choices": [], "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            }})
+        self._send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端关闭空闲的 keep-alive 连接属于正常情况
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class MockServer:
+    """在后台线程中运行的 OpenAI 兼容流式服务"""
+
+    def __init__(self, config: MockConfig = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        handler = type("BoundMockHandler", (MockHandler,), {"config": self.config})
+        self.httpd = QuietHTTPServer((host, port), handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容的流式模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ttft", type=float, default=0.2, help="首个 token 延迟（秒）")
+    parser.add_argument("--tps", type=float, default=200.0, help="每秒输出 token 数")
+    parser.add_argument("--chunk-chars", type=int, default=12, help="每个流式块的字符数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="注入错误的概率")
+    parser.add_argument("--error-status", type=int, default=429, help="注入错误的 HTTP 状态码")
+    parser.add_argument("--seed", type=int, help="错误注入的随机种子")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(args.ttft, args.tps, args.chunk_chars, args.error_rate, args.error_status,
+                        seed=args.seed)
+    server = MockServer(config, args.host, args.port)
+    # 端口为 0 时由系统分配，基准测试从这一行读取实际地址
+    print(f"模拟服务已启动: {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+from typing import List, Tuple
+
+from benchmarks.synthetic import generate_block
+
+DEFAULT_SIZES = "10x5,50x5,200x5"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else 0.0,
+    }
+
+
+def parse_sizes(text: str) -> List[tuple]:
+    """解析 "交易数x每笔log数" 列表，例如 10x5,200x5"""
+    sizes = []
+    for item in text.split(","):
+        transactions, _, logs = item.strip().partition("x")
+        sizes.append((int(transactions), int(logs or 5)))
+    return sizes
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def start_mock(args) -> Tuple[subprocess.Popen, str]:
+    """在子进程中启动模拟服务，避免它的内存分配和 CPU 占用计入测量结果"""
+    command = [
+        sys.executable, "-m", "benchmarks.mock_server", "--port", "0",
+        "--ttft", str(args.ttft), "--tps", str(args.tps), "--chunk-chars", str(args.chunk_chars),
+        "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+        "--seed", str(args.seed),
+    ]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    url = line.partition(": ")[2].strip()
+    if not url:
+        process.kill()
+        raise RuntimeError(f"模拟服务启动失败（退出码 {process.wait()}）")
+    return process, url
+
+
+def mock_stats(url: str) -> dict:
+    """读取模拟服务累计的请求数和错误数"""
+    with urllib.request.urlopen(url + "/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def run_once(block: dict, args) -> dict:
+    """执行一次完整分析，分别计时流式阶段和合并解析阶段"""
+    from deepseekv5 import combine_results, process_in_batches
+
+    start = time.perf_counter()
+    results = process_in_batches(block, batch_size=args.batch_size, max_tokens=args.max_tokens,
+                                 max_workers=args.workers, compact=not args.verbose_format)
+    streamed = time.perf_counter()
+    final = combine_results(results)
+    finished = time.perf_counter()
+    return {
+        "e2e": finished - start,
+        "stream": streamed - start,
+        "parse": finished - streamed,
+        "result": final,
+    }
+
+
+def bench_size(transactions: int, logs: int, args) -> dict:
+    """对一种区块规模重复测量"""
+    from ledger import build_ledger
+
+    block = generate_block(transactions, logs, addresses=args.addresses, tokens=args.tokens,
+                           exponent=args.zipf, seed=args.seed)
+    ledger_start = time.perf_counter()
+    expected = build_ledger(block)
+    ledger_seconds = time.perf_counter() - ledger_start
+
+    e2e, stream, parse = [], [], []
+    failures = 0
+    mismatches = 0
+    for _ in range(args.repeat):
+        try:
+            run = run_once(block, args)
+        except Exception as e:
+            failures += 1
+            print(f"  运行失败: {e}", file=sys.stderr)
+            continue
+        e2e.append(run["e2e"])
+        stream.append(run["stream"])
+        parse.append(run["parse"])
+        if run["result"] != expected:
+            mismatches += 1
+
+    # 单独跑一次统计内存峰值，避免 tracemalloc 的开销影响计时
+    tracemalloc.start()
+    try:
+        run_once(block, args)
+    except Exception:
+        pass
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    total_logs = transactions * logs
+    median = percentile(e2e, 50)
+    return {
+        "transactions": transactions,
+        "logs_per_tx": logs,
+        "runs": len(e2e),
+        "failures": failures,
+        "mismatches": mismatches,
+        "e2e_seconds": summarize(e2e),
+        "stream_seconds": summarize(stream),
+        "parse_seconds": summarize(parse),
+        "ledger_seconds": ledger_seconds,
+        "peak_memory_bytes": peak_bytes,
+        "logs_per_sec": total_logs / median if median else 0.0,
+        "transactions_per_sec": transactions / median if median else 0.0,
+    }
+
+
+def compare(current: dict, baseline_path: str, threshold: float) -> bool:
+    """与基线结果比较 p50 延迟，返回是否存在超过阈值的退化"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {(r["transactions"], r["logs_per_tx"]): r for r in baseline.get("results", [])}
+    regressed = False
+    print(f"\n与基线 {baseline_path}（{baseline.get('meta', {}).get('revision')}）对比:")
+    for result in current["results"]:
+        key = (result["transactions"], result["logs_per_tx"])
+        if key not in previous:
+            continue
+        for metric in ("e2e_seconds", "parse_seconds"):
+            old = previous[key][metric]["p50"]
+            new = result[metric]["p50"]
+            change = (new - old) / old if old else 0.0
+            flag = ""
+            if change > threshold:
+                flag = "  <-- 退化"
+                regressed = True
+            print(f"- {key[0]}x{key[1]} {metric} p50: {old * 1000:.1f} ms -> {new * 1000:.1f} ms "
+                  f"({change:+.1%}){flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="使用本地模拟服务对分析流程做基准测试")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="区块规模列表，格式为 交易数x每笔log数")
+    parser.add_argument("--repeat", type=int, default=5, help="每种规模的重复次数")
+    parser.add_argument("--addresses", type=int, default=200, help="地址池大小")
+    parser.add_argument("--tokens", type=int, default=20, help="代币池大小")
+    parser.add_argument("--zipf", type=float, default=1.1, help="地址/代币复用的 Zipf 指数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批最多包含的交易数，默认只按 token 预算切分")
+    parser.add_argument("--max-tokens", type=int, default=8192, help="每批的最大输出 token 数")
+    parser.add_argument("--workers", type=int, default=32, help="并发请求数，默认与 deepseekv5.MAX_WORKERS 一致")
+    parser.add_argument("--verbose-format", action="store_true", help="不使用紧凑编码")
+    parser.add_argument("--ttft", type=float, default=0.2, help="模拟首个 token 延迟（秒）")
+    parser.add_argument("--tps", type=float, default=200.0, help="模拟每秒输出 token 数")
+    parser.add_argument("--chunk-chars", type=int, default=12, help="模拟每个流式块的字符数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟错误注入概率")
+    parser.add_argument("--error-status", type=int, default=429, help="注入错误的 HTTP 状态码")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="结果 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 比较")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的 p50 增幅")
+    args = parser.parse_args(argv)
+
+    process, url = start_mock(args)
+    try:
+        os.environ["DEEPSEEK_BASE_URL"] = url
+        os.environ.setdefault("DEEPSEEK_API_KEY", "mock")
+
+        results = []
+        for transactions, logs in parse_sizes(args.sizes):
+            print(f"测试 {transactions} 笔交易 x {logs} 条 log ...")
+            result = bench_size(transactions, logs, args)
+            results.append(result)
+            e2e = result["e2e_seconds"]
+            print(f"  e2e p50 {e2e['p50'] * 1000:.1f} ms / p90 {e2e['p90'] * 1000:.1f} ms / "
+                  f"p99 {e2e['p99'] * 1000:.1f} ms，解析 p50 {result['parse_seconds']['p50'] * 1000:.2f} ms，"
+                  f"内存峰值 {result['peak_memory_bytes'] / 1024 / 1024:.1f} MiB，"
+                  f"{result['logs_per_sec']:.0f} log/秒")
+        stats = mock_stats(url)
+    finally:
+        process.terminate()
+        process.wait()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "mock": {"ttft": args.ttft, "tps": args.tps, "chunk_chars": args.chunk_chars,
+                     "error_rate": args.error_rate, "requests": stats["requests"],
+                     "errors": stats["errors"]},
+            "params": {"batch_size": args.batch_size, "max_tokens": args.max_tokens,
+                       "workers": args.workers, "compact": not args.verbose_format,
+                       "repeat": args.repeat, "zipf": args.zipf, "seed": args.seed},
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存到 {args.output}")
+
+    if args.compare and compare(report, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
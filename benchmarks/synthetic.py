@@ -0,0 +1,89 @@
+import argparse
+import bisect
+import itertools
+import json
+import random
+import sys
+from typing import List, Optional
+
+
+class ZipfSampler:
+    """按 Zipf 分布从固定大小的标识符池中抽样，少数地址/代币被大量复用"""
+
+    def __init__(self, population: List[str], exponent: float, rng: random.Random):
+        self.population = population
+        self.rng = rng
+        weights = [1.0 / (rank ** exponent) for rank in range(1, len(population) + 1)]
+        self.cumulative = list(itertools.accumulate(weights))
+
+    def sample(self) -> str:
+        point = self.rng.random() * self.cumulative[-1]
+        return self.population[bisect.bisect_left(self.cumulative, point)]
+
+
+def random_id(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice("0123456789abcdef") for _ in range(length))
+
+
+def random_value(rng: random.Random, null_rate: float) -> Optional[int]:
+    """生成超出 int64 范围的大整数，部分带大量末尾 0，少量为 null"""
+    if rng.random() < null_rate:
+        return None
+    digits = rng.randint(6, 26)
+    value = rng.randrange(10 ** (digits - 1), 10 ** digits)
+    if rng.random() < 0.3:
+        zeros = rng.randint(3, digits - 1)
+        value = value // 10 ** zeros * 10 ** zeros
+    return value
+
+
+def generate_block(transactions: int, logs_per_tx: int, addresses: int = 200, tokens: int = 20,
+                   exponent: float = 1.1, id_length: int = 6, null_rate: float = 0.01,
+                   block_number: int = 20000000, seed: Optional[int] = None) -> dict:
+    """生成与真实输入结构相同的合成区块"""
+    rng = random.Random(seed)
+    address_pool = ZipfSampler([random_id(rng, id_length) for _ in range(addresses)], exponent, rng)
+    token_pool = ZipfSampler([random_id(rng, id_length) for _ in range(tokens)], exponent, rng)
+
+    txs = []
+    for index in range(transactions):
+        logs = []
+        for _ in range(logs_per_tx):
+            sender = address_pool.sample()
+            receiver = address_pool.sample()
+            logs.append({
+                "from": sender,
+                "to": receiver,
+                "value": random_value(rng, null_rate),
+                "token": token_pool.sample(),
+            })
+        txs.append({
+            "from": random_id(rng, id_length),
+            "to": random_id(rng, id_length),
+            "priority_fee": f"{rng.random() / 10:.10f}",
+            "receipt": {"transactionIndex": index, "logs": logs},
+            "txH": random_id(rng, id_length),
+        })
+    return {"blockNumber": block_number, "transactions": txs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成区块，每行一个 JSON")
+    parser.add_argument("-n", "--transactions", type=int, default=100, help="每个区块的交易数")
+    parser.add_argument("-m", "--logs", type=int, default=5, help="每笔交易的 log 数")
+    parser.add_argument("-b", "--blocks", type=int, default=1, help="生成的区块数")
+    parser.add_argument("--addresses", type=int, default=200, help="地址池大小")
+    parser.add_argument("--tokens", type=int, default=20, help="代币池大小")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf 分布指数")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    args = parser.parse_args(argv)
+
+    for i in range(args.blocks):
+        seed = None if args.seed is None else args.seed + i
+        block = generate_block(args.transactions, args.logs, args.addresses, args.tokens,
+                               args.zipf, block_number=20000000 + i, seed=seed)
+        sys.stdout.write(json.dumps(block) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Optional
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "blockchain-analysis")
+
+
+def canonicalize_block(input_data: Any) -> str:
+    """将区块数据规范化为稳定的 JSON 文本（键排序、无多余空白）"""
+    data = input_data
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except json.JSONDecodeError:
+            return data.strip()
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+class ResultCache:
+    """基于内容哈希的磁盘结果缓存，按条目数和总大小做 LRU 淘汰
+
+    每条结果保存为 <key>.json，写入时先写临时文件再 os.replace，
+    多个 Streamlit 进程同时读写同一目录也不会读到半个文件。
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 512,
+                 max_bytes: int = 256 * 1024 * 1024):
+        self.cache_dir = cache_dir or os.getenv("BLOCK_CACHE_DIR") or DEFAULT_CACHE_DIR
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(input_data: Any, system_prompt: str, model: str, temperature: float,
+                 top_p: float, max_tokens: int, batch_size: Optional[int], compact: bool) -> str:
+        """根据区块内容、系统提示、模型、采样参数和分批方式计算缓存键"""
+        digest = hashlib.sha256()
+        params = json.dumps({
+            "model": model,
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_tokens": max_tokens,
+            "batch_size": batch_size,
+            "compact": compact,
+        }, sort_keys=True)
+        for part in (params, system_prompt, canonicalize_block(input_data)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，命中时刷新访问时间"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError, UnicodeDecodeError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """原子写入缓存并按需淘汰最久未使用的条目"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self.evict()
+
+    def evict(self) -> None:
+        """按访问时间从旧到新删除条目，直到满足数量和大小限制"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(".") or not entry.name.endswith(".json"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        count = len(entries)
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # 其他进程已经删除
+                pass
+            count -= 1
+            total -= size
+
+    def clear(self) -> None:
+        """清空缓存目录"""
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        """返回命中/未命中统计"""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
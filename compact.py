@@ -0,0 +1,156 @@
+import json
+from collections import Counter
+from typing import Any, Dict, List, Tuple, Union
+
+from ledger import RECEIVED, SENT, load_block, merge_ledgers, parse_value
+
+# 末尾至少有这么多个 0 的数量才改写为 "尾数e指数"
+MIN_TRAILING_ZEROS = 3
+# uint256 的十进制位数上限，解码时超出即视为无效
+MAX_VALUE_DIGITS = 78
+
+COMPACT_FORMAT_PROMPT = """输入已压缩，地址和代币都用编号表示："x" 为交易列表，每笔为 [transactionIndex, logs]，log 为 [from编号, to编号, value, token编号]，logIndex 为 log 在 logs 中的序号。value 为整数、"3e17"（3 后接 17 个 0）或 null。
+把每条 log 记到发出方的 "s" 和接收方的 "r" 中，value 原样照抄，总量和累积值无需输出：
+{"addresses": {"地址编号": {"代币编号": {"s": [[transactionIndex, logIndex, 接收方编号, value]], "r": [[transactionIndex, logIndex, 发出方编号, value]]}}}}"""
+
+
+def encode_value(value: Any) -> Any:
+    """将末尾有大量 0 的整数改写为精确的 "尾数e指数" 字符串"""
+    if not isinstance(value, int) or isinstance(value, bool) or value == 0:
+        return value
+    text = str(value)
+    stripped = text.rstrip("0")
+    zeros = len(text) - len(stripped)
+    if zeros < MIN_TRAILING_ZEROS:
+        return value
+    return f"{stripped}e{zeros}"
+
+
+def decode_value(value: Any) -> Any:
+    """还原模型输出中的 value，"尾数e指数" 只接受展开后不超过 uint256 位数的非负整数"""
+    if isinstance(value, str):
+        mantissa, sep, exponent = value.strip().lower().partition("e")
+        if sep:
+            valid = (mantissa.isascii() and mantissa.isdigit()
+                     and exponent.isascii() and exponent.isdigit() and len(exponent) <= 2)
+            if not valid or len(mantissa) + int(exponent) > MAX_VALUE_DIGITS:
+                raise ValueError(f"无效的代币数量: {value!r}")
+            return int(mantissa) * 10 ** int(exponent)
+    return parse_value(value)
+
+
+def encode_block(input_data: Union[str, dict, list]) -> Tuple[str, dict]:
+    """将区块编码为带地址/代币符号表的紧凑格式
+
+    只保留分析需要的字段（交易序号和 log 的 from/to/value/token），地址和代币替换为编号，
+    返回 (发送给模型的文本, 解码用的符号表)。
+    """
+    block = load_block(input_data)
+    # 按出现频率分配下标，高频地址/代币得到最短的下标
+    address_counts: Counter = Counter()
+    token_counts: Counter = Counter()
+    for tx in block["transactions"]:
+        for log in (tx.get("receipt") or {}).get("logs") or []:
+            address_counts[log.get("from")] += 1
+            address_counts[log.get("to")] += 1
+            token_counts[log.get("token")] += 1
+    addresses: Dict[str, int] = {
+        address: i for i, (address, _) in enumerate(address_counts.most_common())
+    }
+    tokens: Dict[str, int] = {
+        token: i for i, (token, _) in enumerate(token_counts.most_common())
+    }
+    transactions = []
+    rows = []
+
+    for position, tx in enumerate(block["transactions"]):
+        receipt = tx.get("receipt") or {}
+        logs = receipt.get("logs") or []
+        tx_index = receipt.get("transactionIndex", position)
+        transactions.append({"transactionIndex": tx_index, "txH": tx.get("txH"), "log_count": len(logs)})
+        rows.append([tx_index, [
+            [
+                addresses[log.get("from")],
+                addresses[log.get("to")],
+                encode_value(parse_value(log.get("value"))),
+                tokens[log.get("token")],
+            ]
+            for log in logs
+        ]])
+
+    # 模型只需要按编号归类，地址和代币原文只保存在本地符号表中
+    payload = {"x": rows}
+    tables = {
+        "blockNumber": block.get("blockNumber"),
+        "addresses": list(addresses),
+        "tokens": list(tokens),
+        "transactions": transactions,
+        "null_value_logs": sum(
+            1 for _, logs in rows for log in logs if log[2] is None
+        ),
+    }
+    return json.dumps(payload, separators=(",", ":")), tables
+
+
+def _lookup(table: List[Any], key: Any) -> Any:
+    try:
+        index = int(key)
+    except (TypeError, ValueError):
+        return key
+    return table[index] if 0 <= index < len(table) else key
+
+
+def decode_entry(address: str, token: str, entry: dict, tables: dict) -> dict:
+    """将单个紧凑记录还原为账本格式的 sent/received 计算过程"""
+    tx_hashes = {tx["transactionIndex"]: tx["txH"] for tx in tables["transactions"]}
+    decoded = {}
+    for short, side in (("s", SENT), ("r", RECEIVED)):
+        steps = []
+        for row in entry.get(short) or []:
+            if not isinstance(row, list) or len(row) < 4:
+                continue
+            tx_index, log_index, peer, value = row[:4]
+            peer = _lookup(tables["addresses"], peer)
+            steps.append({
+                "txH": tx_hashes.get(tx_index),
+                "transactionIndex": tx_index,
+                "logIndex": log_index,
+                "type": side,
+                "from": address if side == SENT else peer,
+                "to": peer if side == SENT else address,
+                "value": decode_value(value),
+            })
+        decoded[side] = {"total": 0, "steps": steps}
+    return decoded
+
+
+def decode_record(record: dict, tables: dict) -> dict:
+    """还原流式解析产出的单条记录，并计算累积值"""
+    address = _lookup(tables["addresses"], record.get("address"))
+    token = _lookup(tables["tokens"], record.get("token"))
+    entry = decode_entry(address, token, record, tables)
+    ledger = merge_ledgers([{"addresses": {address: {token: entry}}}])
+    return {"address": address, "token": token, **ledger["addresses"][address][token]}
+
+
+def decode_result(result: Any, tables: dict) -> Any:
+    """将模型的紧凑输出还原为完整标识符，并精确重算总量和累积值"""
+    if not isinstance(result, dict) or not isinstance(result.get("addresses"), dict):
+        return result
+    addresses = {}
+    for address_key, tokens in result["addresses"].items():
+        address = _lookup(tables["addresses"], address_key)
+        for token_key, entry in (tokens or {}).items():
+            token = _lookup(tables["tokens"], token_key)
+            addresses.setdefault(address, {})[token] = decode_entry(address, token, entry, tables)
+
+    decoded = merge_ledgers([{
+        "blockNumber": tables["blockNumber"],
+        "transactions": tables["transactions"],
+        "addresses": addresses,
+        "null_value_logs": tables.get("null_value_logs", 0),
+    }])
+    if result.get("truncated"):
+        decoded["truncated"] = True
+    return decoded
+
@@ -1,140 +1,513 @@
 import json
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, APIConnectionError, APITimeoutError
 import traceback
 import os
+import random
+import sys
 import streamlit as st
-from typing import Generator, Any
+import queue
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import AsyncGenerator, Generator, Any, Callable, Optional
+from ledger import merge_ledgers, count_records
+from stream_parser import StreamingRecordParser, recover_addresses
+from compact import COMPACT_FORMAT_PROMPT, encode_block, decode_record, decode_result
+from tracing import current_trace, stage
 
-def get_client():
-    """获取 OpenAI 客户端实例"""
+MODEL = "deepseek-chat"
+TEMPERATURE = 0.1
+TOP_P = 0.95
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+
+RETRYABLE_ERRORS = (APIConnectionError, APITimeoutError)
+
+# 按 (api_key, base_url) 复用客户端，共享同一个 HTTP 连接池
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_api_key() -> str:
+    """从环境变量或 Streamlit secrets 中读取 API 密钥"""
     api_key = os.getenv('DEEPSEEK_API_KEY')
     if not api_key and hasattr(st, 'secrets'):
-        api_key = st.secrets.get("DEEPSEEK_API_KEY")
+        try:
+            api_key = st.secrets.get("DEEPSEEK_API_KEY")
+        except Exception:
+            # 不在 Streamlit 中运行或没有 secrets 文件
+            api_key = None
     
     if not api_key:
         raise ValueError("DeepSeek API key not found. Please set it in environment variables or Streamlit secrets.")
+    return api_key
+
+def get_client(base_url: Optional[str] = None):
+    """获取 OpenAI 客户端实例，base_url 为空时读取 DEEPSEEK_BASE_URL 环境变量"""
+    api_key = get_api_key()
+    base_url = base_url or os.getenv("DEEPSEEK_BASE_URL") or DEFAULT_BASE_URL
     
-    try:
-        return OpenAI(
-            api_key=api_key,
-            base_url="https://api.deepseek.com",
-        )
-    except Exception as e:
-        print(f"Error initializing OpenAI client: {str(e)}")
-        raise
+    with _clients_lock:
+        client = _clients.get((api_key, base_url))
+        if client is not None:
+            return client
+        try:
+            # 重试统一由 call_with_retry 负责并经过限流器，SDK 自带的重试会绕过限流并放大请求数
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+            )
+        except Exception as e:
+            print(f"Error initializing OpenAI client: {str(e)}")
+            raise
+        _clients[(api_key, base_url)] = client
+        return client
+
+def create_async_client(base_url: Optional[str] = None, http_client=None) -> AsyncOpenAI:
+    """创建异步客户端；由调用方在事件循环内持有并复用"""
+    return AsyncOpenAI(
+        api_key=get_api_key(),
+        base_url=base_url or os.getenv("DEEPSEEK_BASE_URL") or DEFAULT_BASE_URL,
+        http_client=http_client,
+    )
+
+def _completion_kwargs(messages: list, max_tokens: int) -> dict:
+    return dict(
+        model=MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
+        max_tokens=max_tokens,
+        top_p=TOP_P,
+        frequency_penalty=0,
+        presence_penalty=0,
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+
+def _record_request(trace, started: float, first_token: Optional[float], chunks: int, usage) -> None:
+    """把一次流式请求的指标记入追踪"""
+    finished = time.perf_counter()
+    stream_seconds = finished - first_token if first_token is not None else 0.0
+    trace.add_request(
+        ttft=first_token - started if first_token is not None else None,
+        stream_seconds=stream_seconds,
+        total_seconds=finished - started,
+        chunks=chunks,
+        chunks_per_sec=chunks / stream_seconds if stream_seconds else None,
+        prompt_tokens=getattr(usage, "prompt_tokens", None),
+        completion_tokens=getattr(usage, "completion_tokens", None),
+    )
 
 def process_stream(messages: list, max_tokens: int = 8192) -> Generator[str, Any, None]:
     """流式处理输入数据"""
-    client = get_client()
+    with stage("get_client"):
+        client = get_client()
+    trace = current_trace()
     try:
-        stream = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=messages,
-            temperature=0.1,
-            max_tokens=max_tokens,
-            top_p=0.95,
-            frequency_penalty=0,
-            presence_penalty=0,
-            stream=True
-        )
+        started = time.perf_counter()
+        stream = client.chat.completions.create(**_completion_kwargs(messages, max_tokens))
         
+        first_token = None
+        chunks = 0
+        usage = None
         for chunk in stream:
+            # 最后一个块只携带 usage，choices 为空
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
             if chunk.choices[0].delta.content is not None:
+                if trace is not None:
+                    chunks += 1
+                    if first_token is None:
+                        first_token = time.perf_counter()
                 yield chunk.choices[0].delta.content
+
+        if trace is not None:
+            _record_request(trace, started, first_token, chunks, usage)
                 
     except Exception as e:
         print(f"Error in process_stream: {str(e)}")
         print(traceback.format_exc())
         raise
 
-def process_in_batches(input_data: str, progress_bar=None, status_text=None, 
-                      batch_size: int = 2, max_tokens: int = 8192) -> str:
-    """处理输入数据，支持进度显示"""
+async def process_stream_async(client: AsyncOpenAI, messages: list,
+                               max_tokens: int = 8192) -> AsyncGenerator[str, None]:
+    """process_stream 的异步版本，使用调用方共享的 AsyncOpenAI 客户端"""
+    trace = current_trace()
     try:
-        # 获取系统提示
-        system_prompt = """你是区块链以太坊最大可提取价值审计专家，我将把区块数据以json格式发给你，区块数据包含区块元数据和每1笔交易中发生的代币转移log，请你帮我做如下处理：
+        started = time.perf_counter()
+        stream = await client.chat.completions.create(**_completion_kwargs(messages, max_tokens))
+        
+        first_token = None
+        chunks = 0
+        usage = None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].delta.content is not None:
+                if trace is not None:
+                    chunks += 1
+                    if first_token is None:
+                        first_token = time.perf_counter()
+                yield chunk.choices[0].delta.content
+
+        if trace is not None:
+            _record_request(trace, started, first_token, chunks, usage)
+
+    except Exception as e:
+        print(f"Error in process_stream_async: {str(e)}")
+        print(traceback.format_exc())
+        raise
+
+TASK_PROMPT = """你是区块链以太坊最大可提取价值审计专家，我将把区块数据以json格式发给你，区块数据包含区块元数据和每1笔交易中发生的代币转移log，请你帮我做如下处理：
 1. 提取每笔交易的hash地址。
 2. 提取每笔交易的receipt数据中的logs。
 3. 遍历logs并处理。
 4. 根据log中，字段from与字段to代表的是代币发出方与代币接收方，value代表的是代币数量，token代表的是代币种类请你根据from和to地址的交互关系重新组织这些代币转移事件。
-5. 记录每个地址接收和发出的代币数量与种类（请注意，一个地址可能同时接收/发送多种不同的代币。此外，一个地址可能接收/发送多次代币，你需要计算同种代币的操作总和，并展示计算过程，计算过程需要根据每笔log推导发出代币和接收代币两种类型type，to，及代币发出/接收方以及代币数量，此外，每一笔计算过程都算出该种代币及类型的累积值cumulative。）。
+5. 记录每个地址接收和发出的代币数量与种类（请注意，一个地址可能同时接收/发送多种不同的代币。此外，一个地址可能接收/发送多次代币，你需要计算同种代币的操作总和，并展示计算过程，计算过程需要根据每笔log推导发出代币和接收代币两种类型type，to，及代币发出/接收方以及代币数量，此外，每一笔计算过程都算出该种代币及类型的累积值cumulative。）。"""
+
+LEDGER_FORMAT_PROMPT = """输出格式如下（logIndex 为该 log 在所属交易 logs 中的序号，从 0 开始）：
+{"blockNumber": 区块号, "transactions": [{"transactionIndex": 0, "txH": "交易hash", "log_count": log数量}], "addresses": {"地址": {"代币": {"sent": {"total": 总量, "steps": [{"txH": "交易hash", "transactionIndex": 0, "logIndex": 0, "type": "sent", "from": "发出方", "to": "接收方", "value": 数量, "cumulative": 累积值}]}, "received": {"total": 总量, "steps": [...]}}}}}"""
+
+JSON_ONLY_PROMPT = """请直接返回JSON格式的结果，不要添加任何额外的格式化（如markdown代码块）。你的输出应该可以直接被JSON.parse()解析。请确保输出的JSON格式正确，包含所有必要的引号和逗号。"""
+
+# 紧凑格式每批都会重新发送系统提示，只保留模型需要的说明，累积值等计算交给程序
+COMPACT_TASK_PROMPT = """你是以太坊区块审计专家，请按地址和代币整理区块中每笔交易的代币转移 log。"""
+
+COMPACT_JSON_ONLY_PROMPT = """只返回可直接被 JSON.parse() 解析的 JSON，不要使用 markdown 代码块。"""
+
+SYSTEM_PROMPT = "\n\n".join([TASK_PROMPT, LEDGER_FORMAT_PROMPT, JSON_ONLY_PROMPT])
+COMPACT_SYSTEM_PROMPT = "\n".join([COMPACT_TASK_PROMPT, COMPACT_FORMAT_PROMPT, COMPACT_JSON_ONLY_PROMPT])
+
+# 粗略估算：十六进制地址和大整数约每 3 个字符 1 个 token，中文等非 ASCII 字符约每个 1 个 token
+CHARS_PER_TOKEN = 3
+# 每条 log 会在发出方和接收方各生成一条计算过程
+OUTPUT_TOKENS_PER_LOG = 140
+COMPACT_OUTPUT_TOKENS_PER_LOG = 30
+# 单批输入的 token 预算
+MAX_INPUT_TOKENS = 24000
+# 并发请求数上限，批次更少时每批一个线程
+MAX_WORKERS = 32
+
 
-请直接返回JSON格式的结果，不要添加任何额外的格式化（如markdown代码块）。你的输出应该可以直接被JSON.parse()解析。请确保输出的JSON格式正确，包含所有必要的引号和逗号。"""
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数"""
+    ascii_chars = len(text.encode("ascii", "ignore"))
+    return ascii_chars // CHARS_PER_TOKEN + (len(text) - ascii_chars) + 1
 
+
+def split_transactions(transactions: list, batch_size: Optional[int] = None, max_tokens: int = 8192,
+                       max_input_tokens: int = MAX_INPUT_TOKENS,
+                       output_tokens_per_log: int = OUTPUT_TOKENS_PER_LOG) -> list:
+    """按输入/输出 token 预算切分交易，batch_size 不为空时每批最多包含这么多笔交易"""
+    # 预留 20% 余量给 JSON 结构本身
+    output_budget = int(max_tokens * 0.8)
+    batches = []
+    current, input_tokens, output_tokens = [], 0, 0
+    for tx in transactions:
+        log_count = len((tx.get("receipt") or {}).get("logs") or [])
+        tx_input = estimate_tokens(json.dumps(tx))
+        tx_output = log_count * output_tokens_per_log
+        if current and (
+            (batch_size and len(current) >= batch_size)
+            or input_tokens + tx_input > max_input_tokens
+            or output_tokens + tx_output > output_budget
+        ):
+            batches.append(current)
+            current, input_tokens, output_tokens = [], 0, 0
+        current.append(tx)
+        input_tokens += tx_input
+        output_tokens += tx_output
+    if current:
+        batches.append(current)
+    return batches
+
+
+def prepare_batches(data: dict, batch_size: Optional[int] = None, max_tokens: int = 8192,
+                    compact: bool = True) -> list:
+    """切分区块并生成每批发送给模型的文本，返回 [(文本, 符号表或 None, 预计记录数)]
+
+    开启追踪且使用紧凑编码时，把压缩前后的输入 token 估算记到追踪的 prompt_reduction 中：
+    压缩前按原始系统提示加整个区块只发一次计算，压缩后为每批的紧凑系统提示加紧凑文本之和。
+    估算由 estimate_tokens 按字符折算，不是真实分词器的结果。
+    """
+    per_log = COMPACT_OUTPUT_TOKENS_PER_LOG if compact else OUTPUT_TOKENS_PER_LOG
+    batches = split_transactions(data["transactions"], batch_size, max_tokens,
+                                 output_tokens_per_log=per_log) or [[]]
+    trace = current_trace() if compact else None
+    original_tokens = estimate_tokens(SYSTEM_PROMPT + json.dumps(data)) if trace is not None else 0
+    compact_tokens = 0
+    prepared = []
+    for batch in batches:
+        chunk = {**data, "transactions": batch}
+        if compact:
+            content, tables = encode_block(chunk)
+            if trace is not None:
+                compact_tokens += estimate_tokens(COMPACT_SYSTEM_PROMPT + content)
+        else:
+            content, tables = json.dumps(chunk), None
+        prepared.append((content, tables, count_records(chunk)))
+    if trace is not None:
+        trace.attrs["prompt_reduction"] = {
+            "original_tokens_estimate": original_tokens,
+            "compact_tokens_estimate": compact_tokens,
+            "ratio": original_tokens / compact_tokens if compact_tokens else 0.0,
+            "method": f"ASCII {CHARS_PER_TOKEN} 字符/token、其他字符 1 字符/token 估算，含系统提示",
+        }
+    return prepared
+
+
+def is_retryable(error: Exception) -> bool:
+    """429 和 5xx 以及连接/超时错误可以重试"""
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    status = getattr(error, "status_code", None)
+    return status == 429 or (isinstance(status, int) and status >= 500)
+
+def call_with_retry(func, *args, max_retries: int = 5, base_delay: float = 1.0,
+                    max_delay: float = 60.0, limiter=None):
+    """带限流和指数退避重试地调用 func，limiter 为带 acquire() 方法的限流器"""
+    for attempt in range(max_retries + 1):
+        if limiter:
+            limiter.acquire()
+        try:
+            return func(*args)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"请求失败（{e}），{delay:.1f} 秒后第 {attempt + 1} 次重试", file=sys.stderr)
+            time.sleep(delay)
+
+def run_batch(content: str, max_tokens: int = 8192,
+              on_record: Optional[Callable[[dict], Any]] = None,
+              system_prompt: str = SYSTEM_PROMPT) -> str:
+    """对单个批次调用模型，边接收边解析记录，返回完整输出"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": content}
+    ]
+    parser = StreamingRecordParser()
+    for chunk in process_stream(messages, max_tokens):
+        for record in parser.feed(chunk):
+            if on_record:
+                on_record(record)
+    return parser.text()
+
+
+def process_in_batches(input_data: str, progress_bar=None, status_text=None, 
+                      batch_size: Optional[int] = None, max_tokens: int = 8192,
+                      max_workers: int = MAX_WORKERS,
+                      on_records: Optional[Callable[[list], Any]] = None,
+                      compact: bool = True, max_retries: int = 3) -> list:
+    """分批并发处理输入数据，支持进度显示，返回每个批次的结果
+
+    on_records 在主线程中被调用，参数为新完成的 地址/代币 记录列表。
+    compact 为 True 时使用符号表压缩输入，批次结果为已解码的字典，否则为原始输出文本。
+    429/5xx 按指数退避重试，重试后仍失败的批次结果为 {"error": ...}，不影响其他批次。
+    并发数为批次数，最多 max_workers 个，所有批次尽量同时发出。
+    """
+    try:
         if status_text:
             status_text.text("正在解析输入数据...")
             
         # 处理输入数据
-        if isinstance(input_data, str):
-            try:
-                data = json.loads(input_data)
-            except json.JSONDecodeError:
+        with stage("parse_input"):
+            if isinstance(input_data, str):
+                try:
+                    data = json.loads(input_data)
+                except json.JSONDecodeError:
+                    data = input_data
+            else:
                 data = input_data
-        else:
-            data = input_data
 
-        # 将数据转换为字符串
-        if isinstance(data, (dict, list)):
-            data = json.dumps(data)
+        # 将数据按交易切分为多个批次，并统计预计的记录数
+        expected = 0
+        system_prompt = SYSTEM_PROMPT
+        with stage("prepare_batches"):
+            if isinstance(data, dict) and isinstance(data.get("transactions"), list):
+                prepared = prepare_batches(data, batch_size, max_tokens, compact)
+                expected = sum(count for _, _, count in prepared)
+                if compact:
+                    system_prompt = COMPACT_SYSTEM_PROMPT
+            elif isinstance(data, (dict, list)):
+                prepared = [(json.dumps(data), None, 0)]
+            else:
+                prepared = [(data, None, 0)]
+        contents = [content for content, _, _ in prepared]
+        tables = [table for _, table, _ in prepared]
 
         if status_text:
-            status_text.text("正在分析交易数据...")
+            status_text.text(f"正在分析交易数据（共 {len(contents)} 批）...")
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": data}
-        ]
+        # 并发调用模型；工作线程只往队列里放记录，进度和回调都在主线程中处理
+        records = queue.Queue()
+        results = [None] * len(contents)
+        completed = 0
+        # 重试的批次会再次产出失败前已展示过的记录，按 地址/代币 去重
+        shown = [set() for _ in contents]
 
-        # 使用流式输出
-        result = ""
-        for chunk in process_stream(messages, max_tokens):
-            result += chunk
+        def drain():
+            nonlocal completed
+            new_records = []
+            while True:
+                try:
+                    i, record = records.get_nowait()
+                except queue.Empty:
+                    break
+                key = (record.get("address"), record.get("token"))
+                if key in shown[i]:
+                    continue
+                shown[i].add(key)
+                try:
+                    new_records.append(decode_record(record, tables[i]) if tables[i] else record)
+                except ValueError as e:
+                    # 只影响实时展示，最终结果中该批次会记为错误
+                    print(f"Skipping undecodable record: {str(e)}")
+            if not new_records:
+                return
+            completed += len(new_records)
+            if on_records:
+                on_records(new_records)
             if status_text:
-                status_text.text("正在生成分析结果...")
-            if progress_bar:
-                # 这里的进度是估算的
-                progress_bar.progress(min(0.9, len(result) / 1000))
+                status_text.text(f"正在生成分析结果（已完成 {completed}/{expected or '?'} 条记录）...")
+            if progress_bar and expected:
+                progress_bar.progress(min(0.99, completed / expected))
+
+        # 每个任务复制一份上下文，工作线程里的追踪记录归到当前这次分析
+        with stage("model"), \
+                ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(contents)))) as executor:
+            futures = {
+                executor.submit(contextvars.copy_context().run, call_with_retry, run_batch, content,
+                                max_tokens, lambda record, i=i: records.put((i, record)), system_prompt,
+                                max_retries=max_retries): i
+                for i, content in enumerate(contents)
+            }
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                drain()
+                for future in done:
+                    i = futures[future]
+                    try:
+                        results[i] = future.result()
+                        if tables[i]:
+                            with stage("decode"):
+                                results[i] = decode_result(parse_result(results[i]), tables[i])
+                    except Exception as e:
+                        print(f"Error in batch {i}: {str(e)}")
+                        results[i] = {"error": f"第 {i + 1} 批处理失败: {str(e)}"}
+        drain()
 
         if progress_bar:
             progress_bar.progress(1.0)
         if status_text:
             status_text.text("分析完成！")
 
-        return result
+        return results
 
     except Exception as e:
         print(f"Error in process_in_batches: {str(e)}")
         print(traceback.format_exc())
         raise
 
-def combine_results(batch_results: str, status_text=None) -> dict:
+def parse_result(result: str) -> dict:
+    """解析单个批次的模型输出"""
+    # 清理可能的 Markdown 代码块标记
+    cleaned_results = result.strip()
+    if cleaned_results.startswith("```json"):
+        cleaned_results = cleaned_results[7:]  # 移除开头的 ```json
+    if cleaned_results.endswith("```"):
+        cleaned_results = cleaned_results[:-3]  # 移除结尾的 ```
+    cleaned_results = cleaned_results.strip()
+    
+    try:
+        return json.loads(cleaned_results)
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error: {str(e)}")
+        # 输出被截断时保留所有已完整的记录
+        addresses = recover_addresses(cleaned_results)
+        if addresses:
+            return {"blockNumber": None, "transactions": [], "addresses": addresses, "truncated": True}
+        return {"error": "Invalid JSON in results", "raw_results": result}
+
+def combine_results(batch_results, status_text=None) -> dict:
     """合并处理结果"""
     try:
-        if status_text:
-            status_text.text("正在整理分析结果...")
-            
-        # 如果是字符串，尝试解析为 JSON
-        if isinstance(batch_results, str):
-            # 清理可能的 Markdown 代码块标记
-            cleaned_results = batch_results.strip()
-            if cleaned_results.startswith("```json"):
-                cleaned_results = cleaned_results[7:]  # 移除开头的 ```json
-            if cleaned_results.endswith("```"):
-                cleaned_results = cleaned_results[:-3]  # 移除结尾的 ```
-            cleaned_results = cleaned_results.strip()
+        with stage("combine_results"):
+            if status_text:
+                status_text.text("正在整理分析结果...")
             
-            try:
-                return json.loads(cleaned_results)
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {str(e)}")
-                return {"error": "Invalid JSON in results", "raw_results": batch_results}
+            # 单个字符串按只有一个批次处理
+            if isinstance(batch_results, str):
+                batch_results = [batch_results]
+
+            # 多个批次：分别解析后按交易顺序合并
+            if isinstance(batch_results, list):
+                parsed = [
+                    parse_result(result) if isinstance(result, str) else result
+                    for result in batch_results
+                ]
+                parts = [part for part in parsed if isinstance(part, dict) and "addresses" in part]
+                errors = [part for part in parsed if not (isinstance(part, dict) and "addresses" in part)]
+                if not parts and len(errors) == 1:
+                    return errors[0]
+                # 单个批次也重新计算总量和累积值，不直接采用模型给出的数字
+                combined = merge_ledgers(parts)
+                if any(part.get("truncated") for part in parts):
+                    combined["truncated"] = True
+                if errors:
+                    combined["errors"] = errors
+                return combined
         
-        return batch_results
+            return batch_results
     except Exception as e:
         print(f"Error in combine_results: {str(e)}")
         print(traceback.format_exc())
         raise
 
+def analyze_block(input_data, progress_bar=None, status_text=None, batch_size: Optional[int] = None,
+                  max_tokens: int = 8192, cache=None, use_cache: bool = True,
+                  on_records: Optional[Callable[[list], Any]] = None, compact: bool = True,
+                  max_workers: int = MAX_WORKERS) -> dict:
+    """调用模型分析区块，命中缓存时直接返回之前的结果"""
+    key = None
+    if cache is not None:
+        system_prompt = COMPACT_SYSTEM_PROMPT if compact else SYSTEM_PROMPT
+        key = cache.make_key(input_data, system_prompt, MODEL, TEMPERATURE, TOP_P, max_tokens,
+                              batch_size, compact)
+        if use_cache:
+            with stage("cache_lookup"):
+                cached = cache.get(key)
+            if cached is not None:
+                if progress_bar:
+                    progress_bar.progress(1.0)
+                if status_text:
+                    status_text.text("命中缓存！")
+                return cached
+
+    batch_results = process_in_batches(
+        input_data,
+        progress_bar=progress_bar,
+        status_text=status_text,
+        batch_size=batch_size,
+        max_tokens=max_tokens,
+        max_workers=max_workers,
+        on_records=on_records,
+        compact=compact
+    )
+    final_result = combine_results(batch_results, status_text=status_text)
+
+    # 只缓存完整解析成功的结果
+    if key is not None and isinstance(final_result, dict) \
+            and not {"error", "errors", "truncated"} & final_result.keys():
+        with stage("cache_store"):
+            cache.set(key, final_result)
+    return final_result
+
 def main():
     print("开始处理数据...")
     
@@ -152,10 +525,14 @@ def main():
         print("\n开始合并结果...")
         final_results = combine_results(results, status_text)
         
+        output_path = os.path.abspath("deepseek_results.json")
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(final_results, f, ensure_ascii=False, indent=2)
+        
         # 打印简要统计信息
         print(f"\n处理完成:")
-        print(f"- 总交易数: {len(final_results)}")
-        print(f"- 详细结果已保存到 /Users/jarvis/Desktop/deepseek_results.json")
+        print(f"- 总交易数: {len(final_results.get('transactions') or [])}")
+        print(f"- 详细结果已保存到 {output_path}")
         
     except Exception as e:
         print(f"处理过程中出错: {str(e)}")
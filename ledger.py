@@ -0,0 +1,161 @@
+import json
+from typing import Any, Dict, List, Optional, Union
+
+SENT = "sent"
+RECEIVED = "received"
+
+
+def load_block(input_data: Union[str, dict, list]) -> dict:
+    """将输入数据统一解析为区块字典"""
+    data = input_data
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("utf-8")
+    if isinstance(data, str):
+        data = json.loads(data)
+    if isinstance(data, list):
+        # 直接传入交易列表时补齐区块结构
+        data = {"blockNumber": None, "transactions": data}
+    if not isinstance(data, dict) or not isinstance(data.get("transactions"), list):
+        raise ValueError("区块数据必须包含 transactions 列表")
+    return data
+
+
+def parse_value(value: Any) -> Optional[int]:
+    """将 log 中的 value 转换为任意精度整数，null 返回 None"""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise ValueError(f"无效的代币数量: {value!r}")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        if not text:
+            return None
+        return int(text, 16) if text.lower().startswith("0x") else int(text)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    raise ValueError(f"无效的代币数量: {value!r}")
+
+
+def _new_entry() -> dict:
+    return {
+        SENT: {"total": 0, "steps": []},
+        RECEIVED: {"total": 0, "steps": []},
+    }
+
+
+def build_ledger(input_data: Union[str, dict, list]) -> dict:
+    """在本地统计每个地址每种代币的发出/接收总量及累积过程
+
+    输出结构与 combine_results 返回的 JSON 相同：
+    {"blockNumber", "transactions": [...], "addresses": {地址: {代币: {"sent", "received"}}}}
+    """
+    block = load_block(input_data)
+    addresses: Dict[str, Dict[str, dict]] = {}
+    transactions: List[dict] = []
+    null_values = 0
+
+    for position, tx in enumerate(block["transactions"]):
+        receipt = tx.get("receipt") or {}
+        logs = receipt.get("logs") or []
+        tx_index = receipt.get("transactionIndex", position)
+        tx_hash = tx.get("txH")
+        transactions.append({"transactionIndex": tx_index, "txH": tx_hash, "log_count": len(logs)})
+
+        for log_index, log in enumerate(logs):
+            token = log.get("token")
+            sender = log.get("from")
+            receiver = log.get("to")
+            value = parse_value(log.get("value"))
+            if value is None:
+                null_values += 1
+
+            for address, side in ((sender, SENT), (receiver, RECEIVED)):
+                if address is None:
+                    continue
+                entry = addresses.setdefault(address, {}).get(token)
+                if entry is None:
+                    entry = addresses[address][token] = _new_entry()
+                bucket = entry[side]
+                if value is not None:
+                    bucket["total"] += value
+                bucket["steps"].append({
+                    "txH": tx_hash,
+                    "transactionIndex": tx_index,
+                    "logIndex": log_index,
+                    "type": side,
+                    "from": sender,
+                    "to": receiver,
+                    "value": value,
+                    "cumulative": bucket["total"],
+                })
+
+    return {
+        "blockNumber": block.get("blockNumber"),
+        "transactions": transactions,
+        "addresses": addresses,
+        "null_value_logs": null_values,
+    }
+
+
+def count_records(input_data: Union[str, dict, list]) -> int:
+    """统计区块中 地址/代币 记录的数量，用于估算分析进度"""
+    block = load_block(input_data)
+    pairs = set()
+    for tx in block["transactions"]:
+        for log in (tx.get("receipt") or {}).get("logs") or []:
+            token = log.get("token")
+            for address in (log.get("from"), log.get("to")):
+                if address is not None:
+                    pairs.add((address, token))
+    return len(pairs)
+
+
+def merge_ledgers(parts: List[dict]) -> dict:
+    """合并多个分片的统计结果，并按交易顺序重新计算累积值"""
+    block_number = None
+    transactions: Dict[Any, dict] = {}
+    steps_by_key: Dict[tuple, List[dict]] = {}
+    null_values = 0
+
+    for part in parts:
+        if block_number is None:
+            block_number = part.get("blockNumber")
+        null_values += part.get("null_value_logs") or 0
+        for tx in part.get("transactions") or []:
+            transactions.setdefault((tx.get("transactionIndex"), tx.get("txH")), tx)
+        for address, tokens in (part.get("addresses") or {}).items():
+            for token, entry in (tokens or {}).items():
+                for side in (SENT, RECEIVED):
+                    steps = steps_by_key.setdefault((address, token, side), [])
+                    steps.extend((entry.get(side) or {}).get("steps") or [])
+
+    addresses: Dict[str, Dict[str, dict]] = {}
+    for (address, token, side), steps in steps_by_key.items():
+        entry = addresses.setdefault(address, {}).get(token)
+        if entry is None:
+            entry = addresses[address][token] = _new_entry()
+        bucket = entry[side]
+        steps.sort(key=_step_order)
+        for step in steps:
+            value = parse_value(step.get("value"))
+            if value is not None:
+                bucket["total"] += value
+            bucket["steps"].append(dict(step, value=value, cumulative=bucket["total"]))
+
+    return {
+        "blockNumber": block_number,
+        "transactions": sorted(transactions.values(), key=_step_order),
+        "addresses": addresses,
+        "null_value_logs": null_values,
+    }
+
+
+def _step_order(item: dict) -> tuple:
+    tx_index = item.get("transactionIndex")
+    log_index = item.get("logIndex")
+    return (
+        tx_index if isinstance(tx_index, int) else float("inf"),
+        log_index if isinstance(log_index, int) else float("inf"),
+    )
@@ -0,0 +1,323 @@
+from collections import defaultdict, deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from ledger import load_block, parse_value
+
+
+class TransferGraph:
+    """区块内代币转移的有向多重图
+
+    地址和代币都映射为整数下标，边按交易顺序连续存放，
+    transactions[i] 记录第 i 笔交易的边下标区间，by_token 为每种代币的边列表。
+    """
+
+    def __init__(self, block: dict):
+        self.block_number = block.get("blockNumber")
+        self.addresses: List[str] = []
+        self.tokens: List[str] = []
+        self._address_ids: Dict[str, int] = {}
+        self._token_ids: Dict[str, int] = {}
+        # 边的并列数组
+        self.src: List[int] = []
+        self.dst: List[int] = []
+        self.token: List[int] = []
+        self.value: List[Optional[int]] = []
+        self.log_index: List[int] = []
+        self.by_token: Dict[int, List[int]] = defaultdict(list)
+        self._degrees: Optional[List[int]] = None
+        # 每笔交易的 (transactionIndex, txH, 发起方, 边起点, 边终点)
+        self.transactions: List[tuple] = []
+
+        for position, tx in enumerate(block["transactions"]):
+            receipt = tx.get("receipt") or {}
+            start = len(self.src)
+            for log_index, log in enumerate(receipt.get("logs") or []):
+                edge = len(self.src)
+                token = self._intern(log.get("token"), self.tokens, self._token_ids)
+                self.src.append(self._intern(log.get("from"), self.addresses, self._address_ids))
+                self.dst.append(self._intern(log.get("to"), self.addresses, self._address_ids))
+                self.token.append(token)
+                self.value.append(parse_value(log.get("value")))
+                self.log_index.append(log_index)
+                self.by_token[token].append(edge)
+            self.transactions.append((
+                receipt.get("transactionIndex", position), tx.get("txH"), tx.get("from"),
+                start, len(self.src),
+            ))
+
+    @staticmethod
+    def _intern(key, table: List[str], ids: Dict[str, int]) -> int:
+        index = ids.get(key)
+        if index is None:
+            index = ids[key] = len(table)
+            table.append(key)
+        return index
+
+    def degree(self, address: int) -> int:
+        """地址在整个区块中的不同交互对象数量"""
+        if self._degrees is None:
+            peers: Dict[int, set] = defaultdict(set)
+            for sender, receiver in zip(self.src, self.dst):
+                peers[sender].add(receiver)
+                peers[receiver].add(sender)
+            self._degrees = [len(peers[address]) for address in range(len(self.addresses))]
+        return self._degrees[address]
+
+    def net_flows(self, start: int, end: int) -> Dict[int, Dict[int, int]]:
+        """统计边区间内每个地址每种代币的净流入"""
+        net: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        for edge in range(start, end):
+            value = self.value[edge]
+            if value is None:
+                continue
+            net[self.src[edge]][self.token[edge]] -= value
+            net[self.dst[edge]][self.token[edge]] += value
+        return net
+
+
+def _strongly_connected(nodes: Iterable[int], adjacency: Dict[int, List[int]]) -> Dict[int, int]:
+    """迭代版 Tarjan 算法，返回 节点 -> 强连通分量编号"""
+    index: Dict[int, int] = {}
+    lowlink: Dict[int, int] = {}
+    component: Dict[int, int] = {}
+    stack: List[int] = []
+    on_stack = set()
+    counter = 0
+    components = 0
+
+    for root in nodes:
+        if root in index:
+            continue
+        work = [(root, iter(adjacency.get(root, ())))]
+        index[root] = lowlink[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, neighbours = work[-1]
+            advanced = False
+            for neighbour in neighbours:
+                if neighbour not in index:
+                    index[neighbour] = lowlink[neighbour] = counter
+                    counter += 1
+                    stack.append(neighbour)
+                    on_stack.add(neighbour)
+                    work.append((neighbour, iter(adjacency.get(neighbour, ()))))
+                    advanced = True
+                    break
+                if neighbour in on_stack:
+                    lowlink[node] = min(lowlink[node], index[neighbour])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component[member] = components
+                    if member == node:
+                        break
+                components += 1
+    return component
+
+
+def find_arbitrage(graph: TransferGraph) -> List[dict]:
+    """查找交易内的闭环套利：地址处于转移环上，且在其首个发出的代币上净收益为正"""
+    findings = []
+    for tx_index, tx_hash, _, start, end in graph.transactions:
+        if end - start < 2:
+            continue
+        adjacency: Dict[int, List[int]] = defaultdict(list)
+        first_sent: Dict[int, int] = {}
+        for edge in range(start, end):
+            adjacency[graph.src[edge]].append(graph.dst[edge])
+            first_sent.setdefault(graph.src[edge], graph.token[edge])
+
+        component = _strongly_connected(list(adjacency), adjacency)
+        members: Dict[int, List[int]] = defaultdict(list)
+        for node, comp in component.items():
+            members[comp].append(node)
+
+        net = graph.net_flows(start, end)
+        for address, start_token in first_sent.items():
+            cycle = members[component[address]]
+            if len(cycle) < 2 and address not in adjacency[address]:
+                continue
+            if net[address].get(start_token, 0) <= 0:
+                continue
+            findings.append({
+                "type": "arbitrage",
+                "transactionIndex": tx_index,
+                "txH": tx_hash,
+                "address": graph.addresses[address],
+                "start_token": graph.tokens[start_token],
+                "cycle": sorted(graph.addresses[node] for node in cycle),
+                "profit": {
+                    graph.tokens[token]: amount
+                    for token, amount in net[address].items() if amount
+                },
+            })
+    return findings
+
+
+def extract_swaps(graph: TransferGraph, start: int, end: int) -> List[dict]:
+    """从一笔交易中提取兑换：某地址收到代币 X 并发出另一种代币 Y
+
+    收入和支出按 log 顺序配对，不限先后（兼容先付款后回调的池子），每次配对为均摊 O(1)。
+    两个地址互相兑换时两边看起来都像池子，取本交易内交互对象更少的一方作为池子；
+    数量相同时取整个区块中交互对象更多的一方（池子会被许多交易者使用）。
+    """
+    counterparties: Dict[int, set] = defaultdict(set)
+    flows: Dict[int, List[Tuple[str, int]]] = defaultdict(list)
+    for edge in range(start, end):
+        if graph.value[edge] is None:
+            continue
+        sender, receiver = graph.src[edge], graph.dst[edge]
+        counterparties[sender].add(receiver)
+        counterparties[receiver].add(sender)
+        flows[receiver].append(("in", edge))
+        flows[sender].append(("out", edge))
+
+    swaps = []
+    for pool, pool_flows in flows.items():
+        # 方向 -> {代币: 待配对的边队列}，字典按队列出现的先后排列
+        pending: Dict[str, Dict[int, deque]] = {"in": {}, "out": {}}
+        for kind, edge in pool_flows:
+            token = graph.token[edge]
+            queues = pending["out" if kind == "in" else "in"]
+            # 只需跳过与当前代币相同的那一个队列，最多检查两个键
+            match_token = next((t for t in queues if t != token), None)
+            if match_token is None:
+                pending[kind].setdefault(token, deque()).append(edge)
+                continue
+            queue = queues[match_token]
+            match = queue.popleft()
+            if not queue:
+                del queues[match_token]
+            inflow, outflow = (edge, match) if kind == "in" else (match, edge)
+            swaps.append({
+                "pool": pool,
+                "trader": graph.src[inflow],
+                "recipient": graph.dst[outflow],
+                "token_in": graph.token[inflow],
+                "amount_in": graph.value[inflow],
+                "token_out": graph.token[outflow],
+                "amount_out": graph.value[outflow],
+            })
+
+    # 去掉互换中不像池子的一侧
+    views = {(s["pool"], s["trader"], s["token_in"], s["token_out"]) for s in swaps}
+
+    def pool_rank(address: int) -> tuple:
+        return (len(counterparties[address]), -graph.degree(address), graph.addresses[address] or "")
+
+    return [
+        s for s in swaps
+        if (s["trader"], s["pool"], s["token_out"], s["token_in"]) not in views
+        or pool_rank(s["pool"]) < pool_rank(s["trader"])
+    ]
+
+
+def find_sandwiches(graph: TransferGraph) -> List[dict]:
+    """在触及同一池子的相邻交易中查找 抢跑/受害者/尾随 三元组
+
+    抢跑和尾随须由同一交易者完成、方向相反，且出自同一发起方（缺少发起方时只比较交易者）；
+    受害者交易的兑换方向与抢跑相同，交易者和发起方都不是攻击者；
+    至少一种代币上收益为正，否则不算攻击。
+    """
+    # 池子 -> [(交易位置, {(交易者, 输入代币, 输出代币): 兑换})]
+    by_pool: Dict[int, List[tuple]] = defaultdict(list)
+    for position, (_, _, _, start, end) in enumerate(graph.transactions):
+        per_pool: Dict[int, dict] = defaultdict(dict)
+        for swap in extract_swaps(graph, start, end):
+            key = (swap["trader"], swap["token_in"], swap["token_out"])
+            per_pool[swap["pool"]].setdefault(key, swap)
+        for pool, swaps in per_pool.items():
+            by_pool[pool].append((position, swaps))
+
+    findings = []
+    for pool, touched in by_pool.items():
+        touched.sort(key=lambda item: graph.transactions[item[0]][0])
+        for (front_pos, front), (victim_pos, victim), (back_pos, back) in zip(touched, touched[1:], touched[2:]):
+            front_tx, victim_tx, back_tx = (graph.transactions[p] for p in (front_pos, victim_pos, back_pos))
+            if not _same_sender(front_tx[2], back_tx[2]):
+                continue
+            reported = set()
+            for (attacker, token_x, token_y), front_swap in front.items():
+                back_swap = back.get((attacker, token_y, token_x))
+                if back_swap is None or attacker in reported:
+                    continue
+                victim_swap = next(
+                    (s for (trader, t_in, t_out), s in victim.items()
+                     if t_in == token_x and t_out == token_y
+                     and _is_victim(trader, attacker, victim_tx[2], front_tx[2])),
+                    None,
+                )
+                if victim_swap is None:
+                    continue
+                profit = {
+                    graph.tokens[token_x]: back_swap["amount_out"] - front_swap["amount_in"],
+                    graph.tokens[token_y]: front_swap["amount_out"] - back_swap["amount_in"],
+                }
+                if not any(amount > 0 for amount in profit.values()):
+                    continue
+                reported.add(attacker)
+                findings.append({
+                    "type": "sandwich",
+                    "pool": graph.addresses[pool],
+                    "attacker": graph.addresses[attacker],
+                    "tokens": [graph.tokens[token_x], graph.tokens[token_y]],
+                    "front_run": {"transactionIndex": front_tx[0], "txH": front_tx[1]},
+                    "victim": {
+                        "transactionIndex": victim_tx[0],
+                        "txH": victim_tx[1],
+                        "trader": graph.addresses[victim_swap["trader"]],
+                        "recipient": graph.addresses[victim_swap["recipient"]],
+                    },
+                    "back_run": {"transactionIndex": back_tx[0], "txH": back_tx[1]},
+                    "profit": profit,
+                })
+    findings.sort(key=lambda f: (f["front_run"]["transactionIndex"], f["pool"] or ""))
+    return findings
+
+
+def _same_sender(front_sender, back_sender) -> bool:
+    """抢跑和尾随须出自同一发起方；缺少发起方时无法判断，交给交易者比较"""
+    if front_sender is None or back_sender is None:
+        return True
+    return front_sender == back_sender
+
+
+def _is_victim(trader: int, attacker: int, victim_sender, attacker_sender) -> bool:
+    """受害者的交易者不是攻击者，且受害者交易不是攻击者的发起方发出的"""
+    if trader == attacker:
+        return False
+    return victim_sender is None or attacker_sender is None or victim_sender != attacker_sender
+
+
+def detect_mev(input_data: Union[str, dict, list]) -> List[dict]:
+    """检测区块中的闭环套利和三明治攻击"""
+    graph = TransferGraph(load_block(input_data))
+    return find_arbitrage(graph) + find_sandwiches(graph)
+
+
+def scan_blocks(blocks: Iterable[Union[str, dict, list]]) -> Iterator[Tuple[Optional[int], List[dict]]]:
+    """批量扫描多个区块，逐个产出 (区块号, 检测结果)"""
+    for input_data in blocks:
+        block = load_block(input_data)
+        yield block.get("blockNumber"), detect_mev(block)
+
+
+def attach_mev(result: dict, input_data: Union[str, dict, list]) -> dict:
+    """将检测结果附加到 combine_results 的输出中"""
+    if not isinstance(result, dict):
+        return result
+    try:
+        result["mev"] = detect_mev(input_data)
+    except ValueError as e:
+        # 输入不是合法的区块 JSON 时不做检测
+        print(f"MEV detection skipped: {str(e)}")
+    return result
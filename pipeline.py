@@ -0,0 +1,234 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Iterator, Optional, TextIO, Tuple
+
+from compact import decode_result
+from deepseekv5 import (COMPACT_SYSTEM_PROMPT, call_with_retry, combine_results, estimate_tokens,
+                        parse_result, prepare_batches, run_batch)
+from ledger import build_ledger, load_block
+from mev import attach_mev
+from tracing import current_trace, start_metrics_server, start_trace, stage
+
+class TokenBucket:
+    """令牌桶限流器，rate 为每秒补充的令牌数，capacity 为桶容量"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> None:
+        """阻塞直到取得足够的令牌"""
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                delay = (amount - self._tokens) / self.rate
+            time.sleep(delay)
+
+
+def line_hash(line: str) -> str:
+    """输入行的内容摘要，写入每行结果，续跑时用来确认输入没有变化"""
+    return hashlib.sha256(line.encode("utf-8")).hexdigest()[:16]
+
+
+def read_blocks(stream: TextIO, done: Dict[int, Optional[str]]) -> Iterator[Tuple[int, str]]:
+    """逐行读取 JSONL，跳过空行和已完成的行
+
+    已完成的行必须与检查点中记录的摘要一致，否则抛出 ValueError，避免对换过或改过的输入误跳过。
+    """
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if line_no in done:
+            if done[line_no] != line_hash(line):
+                raise ValueError(f"第 {line_no} 行与检查点中记录的输入不一致，"
+                                 f"请确认输入文件未改动，或使用新的输出文件")
+            continue
+        if not line:
+            continue
+        yield line_no, line
+
+
+def load_checkpoint(output_path: str) -> Dict[int, Optional[str]]:
+    """从已有输出中读取已完成的行号及其输入摘要，并截掉崩溃时写了一半的最后一行
+
+    输出文件本身就是检查点：每行结果写完并 fsync 后才算完成。
+    """
+    done = {}
+    if not os.path.exists(output_path):
+        return done
+    valid_size = 0
+    with open(output_path, "rb") as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                row = json.loads(raw)
+                done[row["line"]] = row.get("input_hash")
+            except (json.JSONDecodeError, KeyError, TypeError):
+                break
+            valid_size += len(raw)
+    if valid_size != os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(valid_size)
+    return done
+
+
+def analyze_line(line: str, mode: str, batch_size: Optional[int], max_tokens: int,
+                 limiter: Optional[TokenBucket], max_retries: int, mev: bool = False) -> Tuple[dict, int]:
+    """分析单个区块，返回结果和消耗的 token 数"""
+    # 总是开启追踪，token 数取自每次请求返回的 usage
+    with start_trace("pipeline", force=True, mode=mode):
+        with stage("parse_input"):
+            block = load_block(line)
+        result, tokens = _analyze_block(block, mode, batch_size, max_tokens, limiter, max_retries)
+        if mev:
+            with stage("mev"):
+                attach_mev(result, block)
+        return result, tokens
+
+
+def batch_tokens(requests: list, content: str, output: str) -> int:
+    """一个批次实际消耗的 token 数；服务端没有返回 usage 时按系统提示、输入和输出估算"""
+    used = [r for r in requests if r.get("prompt_tokens") is not None]
+    if used:
+        return sum(r["prompt_tokens"] + (r.get("completion_tokens") or 0) for r in used)
+    return estimate_tokens(COMPACT_SYSTEM_PROMPT + content) + estimate_tokens(output)
+
+
+def _analyze_block(block: dict, mode: str, batch_size: Optional[int], max_tokens: int,
+                   limiter: Optional[TokenBucket], max_retries: int) -> Tuple[dict, int]:
+    if mode == "ledger":
+        with stage("ledger"):
+            return build_ledger(block), 0
+
+    trace = current_trace()
+    outputs = []
+    tokens = 0
+    for content, tables, _ in prepare_batches(block, batch_size, max_tokens, compact=True):
+        requested = len(trace.requests) if trace is not None else 0
+        output = call_with_retry(run_batch, content, max_tokens, None, COMPACT_SYSTEM_PROMPT,
+                                 max_retries=max_retries, limiter=limiter)
+        tokens += batch_tokens(trace.requests[requested:] if trace is not None else [], content, output)
+        with stage("decode"):
+            outputs.append(decode_result(parse_result(output), tables))
+    return combine_results(outputs), tokens
+
+
+def run_pipeline(input_stream: TextIO, output_path: str, mode: str = "llm", concurrency: int = 4,
+                 rate: float = 2.0, batch_size: Optional[int] = None, max_tokens: int = 8192,
+                 max_retries: int = 5, mev: bool = False) -> dict:
+    """并发分析 JSONL 中的所有区块，按完成顺序写出结果"""
+    done = load_checkpoint(output_path)
+    if done:
+        # 能回到开头的输入先整体核对一遍，不一致时在发出任何请求之前就拒绝续跑
+        if input_stream.seekable():
+            for _ in read_blocks(input_stream, done):
+                pass
+            input_stream.seek(0)
+        print(f"从检查点恢复，跳过 {len(done)} 个已完成的区块", file=sys.stderr)
+
+    limiter = TokenBucket(rate) if mode == "llm" and rate > 0 else None
+    lines = read_blocks(input_stream, done)
+    stats = {"blocks": 0, "failed": 0, "tokens": 0}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = {}
+
+        def submit_next() -> bool:
+            try:
+                line_no, line = next(lines)
+            except StopIteration:
+                return False
+            future = executor.submit(analyze_line, line, mode, batch_size, max_tokens,
+                                     limiter, max_retries, mev)
+            pending[future] = (line_no, line_hash(line))
+            return True
+
+        # 最多同时保留 2 倍并发数的区块在内存中
+        while len(pending) < concurrency * 2 and submit_next():
+            pass
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                line_no, input_hash = pending.pop(future)
+                try:
+                    result, tokens = future.result()
+                except Exception as e:
+                    stats["failed"] += 1
+                    print(f"第 {line_no} 行处理失败: {e}", file=sys.stderr)
+                    traceback.print_exc()
+                else:
+                    out.write(json.dumps({
+                        "line": line_no,
+                        "input_hash": input_hash,
+                        "blockNumber": result.get("blockNumber") if isinstance(result, dict) else None,
+                        "result": result,
+                    }, ensure_ascii=False) + "\n")
+                    out.flush()
+                    os.fsync(out.fileno())
+                    stats["blocks"] += 1
+                    stats["tokens"] += tokens
+                submit_next()
+
+    elapsed = time.perf_counter() - start
+    stats["seconds"] = elapsed
+    stats["blocks_per_sec"] = stats["blocks"] / elapsed if elapsed else 0.0
+    stats["tokens_per_sec"] = stats["tokens"] / elapsed if elapsed else 0.0
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量分析 JSONL 格式的区块数据")
+    parser.add_argument("input", nargs="?", default="-", help="输入 JSONL 文件，每行一个区块；默认读取标准输入")
+    parser.add_argument("-o", "--output", required=True, help="输出 JSONL 文件，同时作为断点续跑的检查点")
+    parser.add_argument("--mode", choices=["llm", "ledger"], default="llm", help="分析模式")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="同时处理的区块数")
+    parser.add_argument("--rate", type=float, default=2.0, help="每秒最多发出的模型请求数，0 表示不限流")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批最多包含的交易数，默认只按 token 预算切分")
+    parser.add_argument("--max-tokens", type=int, default=8192, help="每批的最大输出 token 数")
+    parser.add_argument("--max-retries", type=int, default=5, help="429/5xx 时的最大重试次数")
+    parser.add_argument("--mev", action="store_true", help="在结果中附加本地 MEV 检测（三明治、闭环套利）")
+    args = parser.parse_args(argv)
+    start_metrics_server()
+
+    if args.input == "-":
+        input_stream = sys.stdin
+    else:
+        input_stream = open(args.input, "r", encoding="utf-8")
+    try:
+        stats = run_pipeline(input_stream, args.output, mode=args.mode,
+                             concurrency=args.concurrency, rate=args.rate,
+                             batch_size=args.batch_size, max_tokens=args.max_tokens,
+                             max_retries=args.max_retries, mev=args.mev)
+    except ValueError as e:
+        print(f"无法从检查点续跑: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+
+    print(f"处理完成: 成功 {stats['blocks']} 个区块，失败 {stats['failed']} 个，耗时 {stats['seconds']:.2f} 秒")
+    print(f"- 吞吐量: {stats['blocks_per_sec']:.2f} 区块/秒，{stats['tokens_per_sec']:.1f} token/秒")
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Literal, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+from cache import ResultCache
+from compact import decode_record, decode_result
+from deepseekv5 import (COMPACT_SYSTEM_PROMPT, MODEL, SYSTEM_PROMPT, TEMPERATURE, TOP_P,
+                        combine_results, create_async_client, parse_result, prepare_batches,
+                        process_stream_async)
+from ledger import build_ledger
+from mev import attach_mev, detect_mev
+from stream_parser import StreamingRecordParser
+from tracing import stage, start_metrics_server, start_trace
+
+# 同时发往模型的流式请求上限，超出的批次排队等待
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY") or 64)
+# 代币数量为 uint256
+MAX_VALUE = 2 ** 256
+
+
+class Log(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+    from_: str = Field(alias="from", min_length=1)
+    to: str = Field(min_length=1)
+    value: Optional[int] = None
+    token: str = Field(min_length=1)
+
+    @field_validator("value", mode="before")
+    @classmethod
+    def _parse_value(cls, value: Any) -> Optional[int]:
+        # 在事件循环中执行，先检查长度再转换，超出 uint256 的数量在花费 token 之前直接拒绝
+        if value is None:
+            return None
+        if isinstance(value, str):
+            text = value.strip()
+            if not text:
+                return None
+            if text[:2].lower() == "0x":
+                digits, base, max_digits, allowed = text[2:], 16, 64, "0123456789abcdefABCDEF"
+            else:
+                digits, base, max_digits, allowed = text, 10, 78, "0123456789"
+            if not digits or len(digits) > max_digits or any(c not in allowed for c in digits):
+                raise ValueError(f"无效的代币数量: {value!r}")
+            value = int(digits, base)
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value < MAX_VALUE:
+            raise ValueError(f"代币数量必须是 0 到 2**256 - 1 之间的整数: {value!r}")
+        return value
+
+
+class Receipt(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    transactionIndex: int = Field(ge=0)
+    logs: List[Log]
+
+
+class Transaction(BaseModel):
+    model_config = ConfigDict(extra="allow", populate_by_name=True)
+
+    from_: Optional[str] = Field(default=None, alias="from")
+    to: Optional[str] = None
+    txH: str = Field(min_length=1)
+    receipt: Receipt
+
+
+class Block(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    blockNumber: Optional[int] = None
+    transactions: List[Transaction] = Field(min_length=1)
+
+
+class AnalyzeRequest(BaseModel):
+    block: Block
+    mode: Literal["llm", "ledger"] = "llm"
+    compact: bool = True
+    mev: bool = True
+    use_cache: bool = True
+    # 为空时只按 token 预算切分
+    batch_size: Optional[int] = Field(default=None, ge=1, le=100)
+    max_tokens: int = Field(default=8192, ge=256, le=8192)
+
+
+class InFlight:
+    """一次上游分析的事件序列，所有订阅者都从头回放并等待新事件"""
+
+    def __init__(self):
+        self.events: List[dict] = []
+        self.finished = False
+        self.task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+
+    def publish(self, event: dict) -> None:
+        self.events.append(event)
+        self._notify()
+
+    def finish(self) -> None:
+        self.finished = True
+        self._notify()
+
+    def _notify(self) -> None:
+        self._wake.set()
+        self._wake = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[dict]:
+        position = 0
+        while True:
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.finished:
+                return
+            await self._wake.wait()
+
+
+class Coalescer:
+    """合并相同的并发请求：同一个键只发起一次上游调用"""
+
+    def __init__(self):
+        self._inflight: Dict[str, InFlight] = {}
+        self.started = 0
+        self.joined = 0
+
+    def join(self, key: str, run: Callable[[Callable[[dict], None]], Awaitable[None]]) -> InFlight:
+        flight = self._inflight.get(key)
+        if flight is not None:
+            self.joined += 1
+            return flight
+        flight = self._inflight[key] = InFlight()
+        self.started += 1
+        # 上游任务独立于发起请求的客户端，客户端断开也不会取消其他订阅者的结果
+        flight.task = asyncio.create_task(self._run(key, flight, run))
+        return flight
+
+    async def _run(self, key: str, flight: InFlight, run) -> None:
+        try:
+            await run(flight.publish)
+        except Exception as e:
+            print(f"Error in upstream analysis: {str(e)}")
+            flight.publish({"event": "error", "error": str(e)})
+        finally:
+            self._inflight.pop(key, None)
+            flight.finish()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 整个进程共享一个带连接池和 keep-alive 的 HTTP 客户端
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_CONCURRENCY,
+            max_keepalive_connections=UPSTREAM_CONCURRENCY,
+            keepalive_expiry=60,
+        ),
+        timeout=httpx.Timeout(300.0, connect=10.0),
+    )
+    app.state.client = create_async_client(http_client=http_client)
+    app.state.upstream = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+    app.state.coalescer = Coalescer()
+    app.state.cache = ResultCache() if os.getenv("SERVICE_CACHE", "1") != "0" else None
+    start_metrics_server()
+    try:
+        yield
+    finally:
+        await app.state.client.close()
+
+
+app = FastAPI(title="区块链交易分析服务", lifespan=lifespan)
+
+
+def decode_output(text: str, tables: dict) -> dict:
+    """解析并解码一个紧凑格式批次的完整输出"""
+    return decode_result(parse_result(text), tables)
+
+
+def find_mev(block: dict) -> Optional[list]:
+    """检测区块中的 MEV，输入不合法时返回 None"""
+    try:
+        return detect_mev(block)
+    except ValueError as e:
+        print(f"MEV detection skipped: {str(e)}")
+        return None
+
+
+def ledger_result(block: dict, mev: bool) -> dict:
+    """本地计算账本，按需附加 MEV 检测结果"""
+    result = build_ledger(block)
+    return attach_mev(result, block) if mev else result
+
+
+def with_mev(result: Any, findings: Optional[list]) -> Any:
+    """返回附加了 MEV 检测结果的浅拷贝，所有订阅者共享的结果对象不被修改"""
+    if not isinstance(result, dict) or findings is None:
+        return result
+    return {**result, "mev": findings}
+
+
+def combine_with_mev(results: list, block: dict) -> Tuple[Any, Optional[list]]:
+    """合并各批次结果，并对区块只做一次 MEV 检测"""
+    return combine_results(results), find_mev(block)
+
+
+async def run_batch_async(app: FastAPI, content: str, tables: Optional[dict], system_prompt: str,
+                          max_tokens: int, publish: Callable[[dict], None]):
+    """流式分析单个批次，边接收边推送已完成的记录"""
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": content}
+    ]
+    parser = StreamingRecordParser()
+    async with app.state.upstream:
+        async for chunk in process_stream_async(app.state.client, messages, max_tokens):
+            for record in parser.feed(chunk):
+                publish({"event": "record", "record": decode_record(record, tables) if tables else record})
+    if tables:
+        return await asyncio.to_thread(decode_output, parser.text(), tables)
+    return parser.text()
+
+
+async def analyze_upstream(app: FastAPI, block: dict, request: AnalyzeRequest, system_prompt: str,
+                           cache_key: Optional[str], publish: Callable[[dict], None]) -> None:
+    """调用模型分析区块并推送记录和最终结果"""
+    with start_trace("service", mode=request.mode):
+        with stage("prepare_batches"):
+            prepared = await asyncio.to_thread(prepare_batches, block, request.batch_size,
+                                               request.max_tokens, request.compact)
+        with stage("model"):
+            results = await asyncio.gather(*(
+                run_batch_async(app, content, tables, system_prompt, request.max_tokens, publish)
+                for content, tables, _ in prepared
+            ), return_exceptions=True)
+        # 单个批次失败时保留其他批次，由 combine_results 记入 errors
+        results = [
+            {"error": f"第 {i + 1} 批处理失败: {str(result)}"} if isinstance(result, Exception) else result
+            for i, result in enumerate(results)
+        ]
+        # 检测结果与请求参数无关，每次上游分析只算一次，由各订阅者按需附加
+        final_result, findings = await asyncio.to_thread(combine_with_mev, results, block)
+
+    cache = app.state.cache
+    if cache_key and cache is not None and isinstance(final_result, dict) \
+            and not {"error", "errors", "truncated"} & final_result.keys():
+        await asyncio.to_thread(cache.set, cache_key, final_result)
+    publish({"event": "result", "result": final_result, "mev": findings})
+
+
+async def analysis_events(request: AnalyzeRequest) -> AsyncIterator[dict]:
+    """产出一次分析的事件：若干 record，最后是 result 或 error"""
+    # 只保留请求中出现过的字段，缓存键与直接提交原始区块时一致
+    block = request.block.model_dump(by_alias=True, exclude_unset=True)
+    if request.mode == "ledger":
+        result = await asyncio.to_thread(ledger_result, block, request.mev)
+        yield {"event": "result", "result": result}
+        return
+
+    system_prompt = COMPACT_SYSTEM_PROMPT if request.compact else SYSTEM_PROMPT
+    cache = app.state.cache
+    cache_key = await asyncio.to_thread(ResultCache.make_key, block, system_prompt, MODEL, TEMPERATURE,
+                                        TOP_P, request.max_tokens, request.batch_size, request.compact)
+    if request.use_cache and cache is not None:
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            if request.mev:
+                # 每次命中都是新读出的对象，可以直接修改
+                cached = await asyncio.to_thread(attach_mev, cached, block)
+            yield {"event": "result", "result": cached, "cached": True}
+            return
+
+    flight = app.state.coalescer.join(
+        cache_key, lambda publish: analyze_upstream(app, block, request, system_prompt, cache_key, publish)
+    )
+    async for event in flight.subscribe():
+        if event["event"] == "result":
+            result = with_mev(event["result"], event["mev"]) if request.mev else event["result"]
+            event = {"event": "result", "result": result}
+        yield event
+
+
+def _encode(event: dict, sse: bool) -> str:
+    data = json.dumps(event, ensure_ascii=False)
+    if sse:
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+@app.get("/health")
+async def health() -> dict:
+    coalescer = app.state.coalescer
+    return {"status": "ok", "upstream_started": coalescer.started, "coalesced": coalescer.joined}
+
+
+@app.post("/analyze")
+async def analyze(request: AnalyzeRequest) -> JSONResponse:
+    """分析区块并一次性返回最终结果"""
+    async for event in analysis_events(request):
+        if event["event"] == "result":
+            return JSONResponse(event["result"])
+        if event["event"] == "error":
+            raise HTTPException(status_code=502, detail=event["error"])
+    raise HTTPException(status_code=502, detail="上游分析没有返回结果")
+
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: AnalyzeRequest, http_request: Request) -> StreamingResponse:
+    """流式分析：默认 NDJSON，Accept 为 text/event-stream 时使用 SSE"""
+    sse = "text/event-stream" in http_request.headers.get("accept", "")
+
+    async def body() -> AsyncIterator[str]:
+        async for event in analysis_events(request):
+            yield _encode(event, sse)
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+
+def main():
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="区块链交易分析 HTTP 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import io
+import json
+import re
+from typing import List, Optional
+
+# 字符串内部只需要关心引号和转义符
+_STRING_SPECIAL = re.compile(r'["\\]')
+# 结构字符
+_STRUCTURAL = re.compile(r'["{}\[\],:]')
+
+# 记录所在的深度：顶层对象 -> addresses -> 地址 -> 代币
+RECORD_DEPTH = 4
+
+
+class StreamingRecordParser:
+    """增量解析模型的流式输出，每当一个 地址/代币 记录闭合时立即产出
+
+    输入按块喂入 feed()，内部用 io.StringIO 累积完整文本，
+    只对已闭合的记录片段调用 json.loads，整体复杂度与输出长度成线性。
+    """
+
+    def __init__(self):
+        self._text = io.StringIO()
+        # 每层为 [容器类型, 当前键]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_parts: Optional[List[str]] = None
+        self._capture: Optional[List[str]] = None
+        self._started = False
+        self._finished = False
+        self.records: List[dict] = []
+
+    def text(self) -> str:
+        """返回目前收到的完整文本"""
+        return self._text.getvalue()
+
+    def feed(self, chunk: str) -> List[dict]:
+        """喂入一段文本，返回本次新闭合的记录"""
+        self._text.write(chunk)
+        emitted = []
+        pos = 0
+        length = len(chunk)
+        capture_start = 0 if self._capture is not None else None
+
+        while pos < length and not self._finished:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    if self._key_parts is not None:
+                        self._key_parts.append(chunk[pos])
+                    pos += 1
+                    continue
+                match = _STRING_SPECIAL.search(chunk, pos)
+                end = match.start() if match else length
+                if self._key_parts is not None:
+                    self._key_parts.append(chunk[pos:end])
+                if not match:
+                    pos = length
+                    break
+                if match.group() == "\\":
+                    if self._key_parts is not None:
+                        self._key_parts.append("\\")
+                    self._escape = True
+                else:
+                    self._in_string = False
+                    self._close_string()
+                pos = end + 1
+                continue
+
+            if not self._started:
+                # 跳过 ```json 等前缀，直到第一个 {
+                brace = chunk.find("{", pos)
+                if brace < 0:
+                    break
+                pos = brace
+                self._started = True
+
+            match = _STRUCTURAL.search(chunk, pos)
+            if not match:
+                break
+            pos = match.start()
+            char = match.group()
+
+            if char == '"':
+                self._in_string = True
+                if self._expect_key and len(self._stack) < RECORD_DEPTH:
+                    self._key_parts = []
+            elif char == "{":
+                self._stack.append(["{", None])
+                self._expect_key = True
+                if len(self._stack) == RECORD_DEPTH and self._is_record_path():
+                    self._capture = []
+                    capture_start = pos
+            elif char == "[":
+                self._stack.append(["[", None])
+                self._expect_key = False
+            elif char in "}]":
+                depth = len(self._stack)
+                if depth:
+                    self._stack.pop()
+                if depth == RECORD_DEPTH and self._capture is not None:
+                    self._capture.append(chunk[capture_start:pos + 1])
+                    record = self._finish_record("".join(self._capture))
+                    self._capture = None
+                    capture_start = None
+                    if record is not None:
+                        emitted.append(record)
+                if not self._stack:
+                    self._finished = True
+                self._expect_key = False
+            elif char == ",":
+                self._expect_key = bool(self._stack) and self._stack[-1][0] == "{"
+            pos += 1
+
+        if self._capture is not None and capture_start is not None:
+            self._capture.append(chunk[capture_start:])
+        self.records.extend(emitted)
+        return emitted
+
+    def _close_string(self) -> None:
+        if self._expect_key:
+            if self._key_parts is not None:
+                try:
+                    key = json.loads('"' + "".join(self._key_parts) + '"')
+                except json.JSONDecodeError:
+                    key = "".join(self._key_parts)
+                self._stack[-1][1] = key
+            self._key_parts = None
+            self._expect_key = False
+
+    def _is_record_path(self) -> bool:
+        return (
+            self._stack[0][1] == "addresses"
+            and all(level[0] == "{" for level in self._stack[:RECORD_DEPTH])
+        )
+
+    def _finish_record(self, raw: str) -> Optional[dict]:
+        try:
+            entry = json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(entry, dict):
+            return None
+        return {"address": self._stack[1][1], "token": self._stack[2][1], **entry}
+
+
+def recover_addresses(text: str) -> dict:
+    """从被截断的输出中恢复所有已完整闭合的 地址/代币 记录"""
+    parser = StreamingRecordParser()
+    parser.feed(text)
+    addresses = {}
+    for record in parser.records:
+        entry = dict(record)
+        address = entry.pop("address")
+        token = entry.pop("token")
+        addresses.setdefault(address, {})[token] = entry
+    return addresses
@@ -1,6 +1,15 @@
 import streamlit as st
-from deepseekv5 import process_in_batches, combine_results
+from deepseekv5 import MAX_WORKERS, analyze_block, combine_results
+from api_client import analyze_via_api
+from ledger import build_ledger
+from cache import ResultCache
+from tracing import start_trace, stage, start_metrics_server
+from mev import attach_mev
 import json
+import os
+
+# 设置后 LLM 模式通过分析服务调用模型，本进程不需要 API 密钥
+ANALYSIS_API_URL = os.getenv("ANALYSIS_API_URL")
 
 # 配置页面
 st.set_page_config(
@@ -41,14 +50,39 @@ st.markdown("""
 
 st.title("区块链交易分析工具")
 
-# 检查是否有API密钥
-try:
-    if not st.secrets.get("DEEPSEEK_API_KEY"):
-        st.error("请在 Streamlit Cloud 中设置 DEEPSEEK_API_KEY")
-        st.stop()
-except Exception as e:
-    st.error("请在 Streamlit Cloud 中设置 DEEPSEEK_API_KEY")
-    st.stop()
+@st.cache_resource
+def get_result_cache():
+    """所有会话共享同一个磁盘缓存实例"""
+    return ResultCache()
+
+@st.cache_resource
+def get_metrics_server():
+    """设置了 TRACE_METRICS_PORT 时启动 Prometheus 文本指标接口"""
+    return start_metrics_server()
+
+get_metrics_server()
+
+# JavaScript 只能精确表示 2**53 以内的整数
+MAX_SAFE_INTEGER = 2 ** 53 - 1
+
+def has_api_key() -> bool:
+    """检查是否设置了 API 密钥，只有直接调用模型的 LLM 模式需要"""
+    if ANALYSIS_API_URL or os.getenv("DEEPSEEK_API_KEY"):
+        return True
+    try:
+        return bool(st.secrets.get("DEEPSEEK_API_KEY"))
+    except Exception:
+        return False
+
+def display_value(value):
+    """将超出浏览器精度的整数转换为字符串，避免 st.json 显示时被舍入"""
+    if isinstance(value, dict):
+        return {key: display_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [display_value(item) for item in value]
+    if isinstance(value, int) and not isinstance(value, bool) and abs(value) > MAX_SAFE_INTEGER:
+        return str(value)
+    return value
 
 # 输入区域
 with st.form("analysis_form"):
@@ -59,11 +93,25 @@ with st.form("analysis_form"):
         placeholder="在此粘贴 JSON 格式的区块链数据..."
     )
     
+    analysis_mode = st.radio(
+        "分析模式：",
+        ["本地账本", "LLM 叙述"],
+        horizontal=True,
+        help="本地账本在本机精确统计代币流转；LLM 叙述调用 DeepSeek 生成分析"
+    )
+    
+    bypass_cache = st.checkbox(
+        "跳过缓存",
+        help="忽略已缓存的分析结果，重新调用模型并刷新缓存"
+    )
+    
     submitted = st.form_submit_button("分析数据", type="primary")
 
 if submitted:
     if not input_data.strip():
         st.error("请先输入数据")
+    elif analysis_mode == "LLM 叙述" and not has_api_key():
+        st.error("请在 Streamlit Cloud 中设置 DEEPSEEK_API_KEY")
     else:
         try:
             # 创建进度条和状态文本
@@ -72,24 +120,70 @@ if submitted:
             
             # 处理数据
             status_text.text("开始分析数据...")
-            batch_results = process_in_batches(
-                input_data, 
-                progress_bar=progress_bar,
-                status_text=status_text,
-                batch_size=2, 
-                max_tokens=8192
-            )
-            
-            # 合并结果
-            final_result = combine_results(batch_results, status_text=status_text)
+            with start_trace("streamlit", force=True, mode=analysis_mode) as trace:
+                if analysis_mode == "本地账本":
+                    with stage("ledger"):
+                        ledger_result = build_ledger(input_data)
+                    final_result = combine_results(ledger_result, status_text=status_text)
+                else:
+                    # 流式输出过程中实时展示已完成的记录
+                    partial_table = st.empty()
+                    partial_rows = []
+                
+                    def show_records(records):
+                        for record in records:
+                            partial_rows.append({
+                                "地址": record["address"],
+                                "代币": record["token"],
+                                "发出总量": str((record.get("sent") or {}).get("total", "")),
+                                "接收总量": str((record.get("received") or {}).get("total", "")),
+                            })
+                        partial_table.dataframe(partial_rows, use_container_width=True)
+                
+                    if ANALYSIS_API_URL:
+                        with stage("api"):
+                            final_result = analyze_via_api(
+                                ANALYSIS_API_URL,
+                                input_data,
+                                progress_bar=progress_bar,
+                                status_text=status_text,
+                                max_tokens=8192,
+                                use_cache=not bypass_cache,
+                                on_records=show_records
+                            )
+                        partial_table.empty()
+                    else:
+                        result_cache = get_result_cache()
+                        final_result = analyze_block(
+                            input_data, 
+                            progress_bar=progress_bar,
+                            status_text=status_text,
+                            max_tokens=8192,
+                            cache=result_cache,
+                            use_cache=not bypass_cache,
+                            on_records=show_records,
+                            max_workers=MAX_WORKERS
+                        )
+                        partial_table.empty()
+                        stats = result_cache.stats()
+                        st.caption(f"缓存命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
+                
+                # 本地检测三明治攻击和闭环套利
+                with stage("mev"):
+                    final_result = attach_mev(final_result, input_data)
             
             # 清理进度显示
             progress_bar.empty()
             status_text.empty()
             
             # 显示结果
+            mev_findings = final_result.get("mev") if isinstance(final_result, dict) else None
+            if mev_findings:
+                with st.expander(f"MEV 检测结果（{len(mev_findings)} 条）", expanded=True):
+                    st.json(display_value(mev_findings))
+            
             with st.expander("查看分析结果", expanded=True):
-                st.json(final_result)
+                st.json(display_value(final_result))
             
             # 提供下载选项
             st.download_button(
@@ -99,6 +193,22 @@ if submitted:
                 mime="application/json",
                 help="点击下载 JSON 格式的分析结果"
             )
+            
+            # 显示本次分析各阶段的耗时
+            with st.expander("诊断信息", expanded=False):
+                summary = trace.summary()
+                ttft = summary["ttft_seconds"]["avg"]
+                chunks_per_sec = summary["chunks_per_sec"]
+                cols = st.columns(4)
+                cols[0].metric("总耗时", f"{summary['total_seconds'] * 1000:.0f} ms")
+                cols[1].metric("平均首 token 延迟", f"{ttft * 1000:.0f} ms" if ttft is not None else "-")
+                cols[2].metric("流式块/秒", f"{chunks_per_sec:.1f}" if chunks_per_sec else "-")
+                cols[3].metric("Token（输入/输出）", f"{summary['prompt_tokens']}/{summary['completion_tokens']}")
+                st.table([
+                    {"阶段": name, "耗时 (ms)": f"{seconds * 1000:.1f}"}
+                    for name, seconds in summary["stages"].items()
+                ])
+                st.json(summary)
         except Exception as e:
             # 清理进度显示
             if 'progress_bar' in locals():
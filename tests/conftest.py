@@ -0,0 +1,16 @@
+import copy
+import json
+import os
+
+import pytest
+
+# deepseekv5.main() 中使用的示例区块
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), "sample_block.json")
+
+with open(SAMPLE_PATH, "r", encoding="utf-8") as f:
+    _SAMPLE_BLOCK = json.load(f)
+
+
+@pytest.fixture
+def sample_block():
+    return copy.deepcopy(_SAMPLE_BLOCK)
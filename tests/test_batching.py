@@ -0,0 +1,92 @@
+import json
+import threading
+
+from deepseekv5 import OUTPUT_TOKENS_PER_LOG, combine_results, estimate_tokens, split_transactions
+from ledger import build_ledger
+
+
+def make_tx(index, logs=1, padding=0):
+    return {
+        "txH": f"0x{index:064x}",
+        "memo": "x" * padding,
+        "receipt": {
+            "transactionIndex": index,
+            "logs": [{"from": "0xa", "to": "0xb", "value": "1", "token": "0xc"}] * logs,
+        },
+    }
+
+
+def test_split_by_count():
+    transactions = [make_tx(i) for i in range(5)]
+    batches = split_transactions(transactions, batch_size=2)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [tx for batch in batches for tx in batch] == transactions
+
+
+def test_split_by_input_budget():
+    transactions = [make_tx(i, padding=3000) for i in range(4)]
+    per_tx = estimate_tokens(json.dumps(transactions[0]))
+    batches = split_transactions(transactions, batch_size=100, max_input_tokens=per_tx * 2)
+    assert [len(batch) for batch in batches] == [2, 2]
+
+
+def test_split_by_output_budget():
+    # 8192 * 0.8 的输出预算按每条日志 OUTPUT_TOKENS_PER_LOG 折算
+    logs_per_budget = int(8192 * 0.8) // OUTPUT_TOKENS_PER_LOG
+    transactions = [make_tx(i, logs=logs_per_budget // 2) for i in range(5)]
+    batches = split_transactions(transactions, batch_size=100, max_tokens=8192)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_oversized_transaction_gets_its_own_batch():
+    transactions = [make_tx(0), make_tx(1, logs=1000), make_tx(2)]
+    batches = split_transactions(transactions, batch_size=100, max_tokens=1024)
+    assert [len(batch) for batch in batches] == [1, 1, 1]
+
+
+def test_combine_keeps_successful_batches_next_to_errors(sample_block):
+    transactions = sample_block["transactions"]
+    first = build_ledger({**sample_block, "transactions": transactions[:5]})
+    last = build_ledger({**sample_block, "transactions": transactions[10:]})
+    error = {"error": "第 2 批处理失败: boom"}
+
+    combined = combine_results([first, error, json.dumps(last)])
+
+    assert combined["errors"] == [error]
+    expected = build_ledger({**sample_block, "transactions": transactions[:5] + transactions[10:]})
+    assert combined["addresses"] == expected["addresses"]
+
+
+def test_combine_single_error_is_returned_as_is():
+    error = {"error": "第 1 批处理失败: boom"}
+    assert combine_results([error]) == error
+
+
+def test_retried_batch_does_not_repeat_records(sample_block, monkeypatch):
+    import deepseekv5
+
+    attempts = []
+    lock = threading.Lock()
+
+    def flaky_stream(messages, max_tokens):
+        reply = json.dumps(build_ledger(json.loads(messages[1]["content"])))
+        with lock:
+            attempts.append(1)
+            first = len(attempts) == 1
+        if first:
+            # 先输出一半再断开，重试时整批重新输出
+            yield reply[:len(reply) // 2]
+            raise deepseekv5.APIConnectionError(request=None)
+        yield reply
+
+    monkeypatch.setattr(deepseekv5, "process_stream", flaky_stream)
+    monkeypatch.setattr(deepseekv5.time, "sleep", lambda delay: None)
+    shown = []
+    results = deepseekv5.process_in_batches(sample_block, batch_size=100, compact=False,
+                                            on_records=shown.extend)
+
+    assert len(attempts) == len(results) + 1
+    # 每个批次的每个 地址/代币 只展示一次
+    parsed = [json.loads(result) for result in results]
+    assert len(shown) == sum(len(tokens) for ledger in parsed for tokens in ledger["addresses"].values())
+    assert combine_results(results)["addresses"] == build_ledger(sample_block)["addresses"]
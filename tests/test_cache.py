@@ -0,0 +1,91 @@
+import json
+import os
+
+import pytest
+
+from cache import ResultCache
+
+PARAMS = dict(system_prompt="prompt", model="deepseek-chat", temperature=0.0, top_p=1.0,
+              max_tokens=8192, batch_size=2, compact=True)
+
+
+def make_key(block, **overrides):
+    return ResultCache.make_key(block, **{**PARAMS, **overrides})
+
+
+def age(cache, key, seconds_ago):
+    """显式设置访问时间，不依赖文件系统的时间精度"""
+    path = os.path.join(cache.cache_dir, f"{key}.json")
+    mtime = 1_000_000_000 - seconds_ago
+    os.utime(path, (mtime, mtime))
+
+
+def stored(cache):
+    return sorted(name[:-5] for name in os.listdir(cache.cache_dir) if name.endswith(".json"))
+
+
+def test_key_ignores_whitespace_and_key_order(sample_block):
+    reordered = json.loads(json.dumps(sample_block), object_pairs_hook=lambda pairs: dict(reversed(pairs)))
+    spaced = json.dumps(sample_block, indent=4)
+    key = make_key(sample_block)
+    assert make_key(reordered) == key
+    assert make_key(spaced) == key
+    assert make_key(" " + json.dumps(sample_block) + "\n") == key
+
+
+@pytest.mark.parametrize("name, value", [
+    ("system_prompt", "other prompt"),
+    ("model", "deepseek-reasoner"),
+    ("max_tokens", 4096),
+    ("batch_size", 4),
+    ("compact", False),
+])
+def test_key_changes_with_parameters(sample_block, name, value):
+    assert make_key(sample_block, **{name: value}) != make_key(sample_block)
+
+
+def test_key_changes_with_block(sample_block):
+    changed = {**sample_block, "blockNumber": (sample_block.get("blockNumber") or 0) + 1}
+    assert make_key(changed) != make_key(sample_block)
+
+
+def test_evicts_least_recently_used_by_count(tmp_path):
+    cache = ResultCache(str(tmp_path), max_entries=2)
+    cache.set("a", {"n": 1})
+    cache.set("b", {"n": 2})
+    age(cache, "a", 20)
+    age(cache, "b", 10)
+    # 读取 a 会刷新它的访问时间，b 成为最久未使用的条目
+    assert cache.get("a") == {"n": 1}
+    cache.set("c", {"n": 3})
+    assert stored(cache) == ["a", "c"]
+
+
+def test_evicts_least_recently_used_by_size(tmp_path):
+    value = {"data": "x" * 1000}
+    cache = ResultCache(str(tmp_path), max_entries=100, max_bytes=2500)
+    cache.set("a", value)
+    cache.set("b", value)
+    age(cache, "a", 10)
+    age(cache, "b", 20)
+    cache.set("c", value)
+    assert stored(cache) == ["a", "c"]
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    assert cache.get("missing") is None
+    cache.set("key", {"n": 1})
+    assert cache.get("key") == {"n": 1}
+    assert cache.get("key") == {"n": 1}
+    assert cache.stats() == {"hits": 2, "misses": 1, "hit_rate": 2 / 3}
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    (tmp_path / "broken.json").write_text('{"addresses": ', encoding="utf-8")
+    (tmp_path / "binary.json").write_bytes(b"\xff\xfe\x00")
+    assert cache.get("broken") is None
+    assert cache.get("binary") is None
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["hits"] == 0
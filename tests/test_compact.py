@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from benchmarks.mock_server import compact_reply
+from compact import decode_record, decode_result, decode_value, encode_block, encode_value
+from deepseekv5 import prepare_batches
+from ledger import build_ledger, merge_ledgers
+from tracing import start_trace
+
+
+def model_reply(content):
+    """按紧凑格式给出正确答案，值原样照抄输入"""
+    return json.loads(json.dumps(compact_reply(json.loads(content))))
+
+
+def test_round_trip_matches_build_ledger(sample_block):
+    content, tables = encode_block(sample_block)
+    assert decode_result(model_reply(content), tables) == build_ledger(sample_block)
+
+
+@pytest.mark.parametrize("size", [1, 2, 4])
+def test_batched_round_trip_matches_build_ledger(sample_block, size):
+    transactions = sample_block["transactions"]
+    parts = []
+    for i in range(0, len(transactions), size):
+        content, tables = encode_block({**sample_block, "transactions": transactions[i:i + size]})
+        parts.append(decode_result(model_reply(content), tables))
+    assert merge_ledgers(parts) == build_ledger(sample_block)
+
+
+def test_decode_record_matches_ledger_entry(sample_block):
+    content, tables = encode_block(sample_block)
+    ledger = build_ledger(sample_block)
+    for address_key, tokens in model_reply(content)["addresses"].items():
+        for token_key, entry in tokens.items():
+            record = decode_record({"address": address_key, "token": token_key, **entry}, tables)
+            expected = ledger["addresses"][record["address"]][record["token"]]
+            assert {k: v for k, v in record.items() if k not in ("address", "token")} == expected
+
+
+def test_compact_text_is_smaller(sample_block):
+    content, tables = encode_block(sample_block)
+    assert len(content) * 2 < len(json.dumps(sample_block))
+    assert tables["null_value_logs"] == 1
+    assert "516917880056056402625961" in content
+
+
+def test_raw_string_values_are_normalized():
+    block = {"blockNumber": 1, "transactions": [{"txH": "h", "receipt": {"transactionIndex": 0, "logs": [
+        {"from": "a", "to": "b", "value": "0x3e8", "token": "t"},
+        {"from": "b", "to": "a", "value": "2000000", "token": "t"},
+    ]}}]}
+    content, tables = encode_block(block)
+    assert json.loads(content)["x"][0][1] == [[0, 1, "1e3", 0], [1, 0, "2e6", 0]]
+    assert decode_result(model_reply(content), tables) == build_ledger(block)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0, 0), (None, None), (123, 123), (1000, "1e3"), (1200, 1200), (3 * 10 ** 17, "3e17"),
+])
+def test_encode_value(value, expected):
+    assert encode_value(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("3e17", 3 * 10 ** 17), ("1e77", 10 ** 77), (42, 42), ("42", 42), (None, None),
+])
+def test_decode_value(value, expected):
+    assert decode_value(value) == expected
+
+
+@pytest.mark.parametrize("value", ["1e-3", "1e10000000", "10e77", "1.5e3", "e5", "1e", "１e3", 1.5])
+def test_decode_value_rejects_invalid_exponents(value):
+    with pytest.raises(ValueError):
+        decode_value(value)
+
+
+def test_default_batches_reduce_prompt_three_times(sample_block):
+    # 压缩后的估算包含每批重复发送的系统提示
+    with start_trace("test", force=True) as trace:
+        prepared = prepare_batches(sample_block)
+    reduction = trace.attrs["prompt_reduction"]
+    assert len(prepared) == 1
+    assert reduction["ratio"] >= 3
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+from ledger import build_ledger, count_records, load_block, merge_ledgers, parse_value
+
+
+def split_block(block, size):
+    return [
+        {**block, "transactions": block["transactions"][i:i + size]}
+        for i in range(0, len(block["transactions"]), size)
+    ]
+
+
+def test_null_value_log_is_kept_as_a_step(sample_block):
+    ledger = build_ledger(sample_block)
+    assert ledger["null_value_logs"] == 1
+    sent = ledger["addresses"]["0fff9e"]["86871d"]["sent"]
+    assert sent["total"] == 0
+    assert sent["steps"] == [{
+        "txH": "4406a1", "transactionIndex": 69, "logIndex": 2, "type": "sent",
+        "from": "0fff9e", "to": "b80ca4", "value": None, "cumulative": 0,
+    }]
+
+
+def test_large_totals_are_exact(sample_block):
+    ledger = build_ledger(sample_block)
+    for address, side in (("7b526e", "sent"), ("5dc6e7", "received"), ("5dc6e7", "sent"), ("6bb076", "received")):
+        assert ledger["addresses"][address]["62b0ff"][side]["total"] == 516917880056056402625961
+    # JSON 往返后仍然是精确整数
+    restored = json.loads(json.dumps(ledger))
+    assert restored["addresses"]["7b526e"]["62b0ff"]["sent"]["total"] == 516917880056056402625961
+
+
+def test_cumulative_follows_transaction_order(sample_block):
+    steps = build_ledger(sample_block)["addresses"]["85dbee"]["fb1b63"]["sent"]["steps"]
+    assert [(s["transactionIndex"], s["logIndex"]) for s in steps] == sorted(
+        (s["transactionIndex"], s["logIndex"]) for s in steps)
+    running = 0
+    for step in steps:
+        running += step["value"]
+        assert step["cumulative"] == running
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 100])
+def test_merging_batches_matches_whole_block(sample_block, size):
+    parts = [build_ledger(part) for part in split_block(sample_block, size)]
+    assert merge_ledgers(parts) == build_ledger(sample_block)
+
+
+def test_merge_recomputes_totals_and_ignores_part_order(sample_block):
+    parts = [build_ledger(part) for part in split_block(sample_block, 3)]
+    parts[0]["addresses"]["85dbee"]["fb1b63"]["sent"]["total"] = 1
+    parts[0]["addresses"]["85dbee"]["fb1b63"]["sent"]["steps"][0]["cumulative"] = 1
+    assert merge_ledgers(list(reversed(parts))) == build_ledger(sample_block)
+
+
+def test_count_records(sample_block):
+    ledger = build_ledger(sample_block)
+    assert count_records(sample_block) == sum(len(tokens) for tokens in ledger["addresses"].values())
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None), ("", None), (5, 5), ("12", 12), ("0x10", 16), (3.0, 3),
+    ("516917880056056402625961", 516917880056056402625961),
+])
+def test_parse_value(value, expected):
+    assert parse_value(value) == expected
+
+
+@pytest.mark.parametrize("value", ["1e-3", "3e17", "abc", 1.5, True, [1]])
+def test_parse_value_rejects_non_integers(value):
+    with pytest.raises(ValueError):
+        parse_value(value)
+
+
+def test_load_block_accepts_transaction_list(sample_block):
+    block = load_block(json.dumps(sample_block["transactions"]))
+    assert block["blockNumber"] is None
+    assert len(block["transactions"]) == len(sample_block["transactions"])
+    with pytest.raises(ValueError):
+        load_block({"blockNumber": 1})
@@ -0,0 +1,111 @@
+import pytest
+
+from mev import TransferGraph, detect_mev, extract_swaps, find_arbitrage, find_sandwiches
+
+
+def swap_tx(index, sender, trader, amount_in, token_in, amount_out, token_out, pool="pool"):
+    return {"from": sender, "txH": f"h{index}", "receipt": {"transactionIndex": index, "logs": [
+        {"from": trader, "to": pool, "value": amount_in, "token": token_in},
+        {"from": pool, "to": trader, "value": amount_out, "token": token_out},
+    ]}}
+
+
+def block(*transactions):
+    return {"blockNumber": 1, "transactions": list(transactions)}
+
+
+def test_sandwich_true_positive():
+    findings = detect_mev(block(
+        swap_tx(0, "bot", "atk", 100, "X", 50, "Y"),
+        swap_tx(1, "alice", "vic", 100, "X", 45, "Y"),
+        swap_tx(2, "bot", "atk", 50, "Y", 110, "X"),
+    ))
+    assert findings == [{
+        "type": "sandwich",
+        "pool": "pool",
+        "attacker": "atk",
+        "tokens": ["X", "Y"],
+        "front_run": {"transactionIndex": 0, "txH": "h0"},
+        "victim": {"transactionIndex": 1, "txH": "h1", "trader": "vic", "recipient": "vic"},
+        "back_run": {"transactionIndex": 2, "txH": "h2"},
+        "profit": {"X": 10, "Y": 0},
+    }]
+
+
+def test_unrelated_users_through_shared_router_are_not_a_sandwich():
+    assert detect_mev(block(
+        swap_tx(0, "userA", "router", 100, "X", 50, "Y"),
+        swap_tx(1, "userB", "router", 100, "X", 45, "Y"),
+        swap_tx(2, "userC", "router", 50, "Y", 21, "X"),
+    )) == []
+
+
+@pytest.mark.parametrize("transactions", [
+    # 尾随亏损
+    [swap_tx(0, "bot", "atk", 100, "X", 50, "Y"), swap_tx(1, "alice", "vic", 100, "X", 45, "Y"),
+     swap_tx(2, "bot", "atk", 50, "Y", 90, "X")],
+    # 抢跑和尾随出自不同发起方
+    [swap_tx(0, "bot", "atk", 100, "X", 50, "Y"), swap_tx(1, "alice", "vic", 100, "X", 45, "Y"),
+     swap_tx(2, "other", "atk", 50, "Y", 110, "X")],
+    # 中间交易由攻击者自己发出
+    [swap_tx(0, "bot", "atk", 100, "X", 50, "Y"), swap_tx(1, "bot", "vic", 100, "X", 45, "Y"),
+     swap_tx(2, "bot", "atk", 50, "Y", 110, "X")],
+    # 中间交易方向相反
+    [swap_tx(0, "bot", "atk", 100, "X", 50, "Y"), swap_tx(1, "alice", "vic", 45, "Y", 100, "X"),
+     swap_tx(2, "bot", "atk", 50, "Y", 110, "X")],
+])
+def test_sandwich_false_positives(transactions):
+    assert find_sandwiches(TransferGraph(block(*transactions))) == []
+
+
+def test_sample_block_self_trades_are_not_sandwiches(sample_block):
+    # 交易 0/1/2 都是 85dbee 在 9c3c9b 上同向兑换，发起方各不相同，且没有获利
+    assert find_sandwiches(TransferGraph(sample_block)) == []
+
+
+def test_cyclic_arbitrage():
+    tx = {"from": "bot", "txH": "h0", "receipt": {"transactionIndex": 0, "logs": [
+        {"from": "bot", "to": "p1", "value": 100, "token": "X"},
+        {"from": "p1", "to": "p2", "value": 7, "token": "Y"},
+        {"from": "p2", "to": "bot", "value": 105, "token": "X"},
+    ]}}
+    findings = find_arbitrage(TransferGraph(block(tx)))
+    assert [(f["address"], f["start_token"], f["profit"]) for f in findings] == [("bot", "X", {"X": 5})]
+    assert findings[0]["cycle"] == ["bot", "p1", "p2"]
+
+
+def test_plain_transfers_are_not_arbitrage():
+    tx = {"from": "a", "txH": "h0", "receipt": {"transactionIndex": 0, "logs": [
+        {"from": "a", "to": "b", "value": 100, "token": "X"},
+        {"from": "b", "to": "c", "value": 100, "token": "X"},
+    ]}}
+    assert find_arbitrage(TransferGraph(block(tx))) == []
+
+
+class CountingList(list):
+    """统计下标访问次数，用操作数而不是耗时衡量复杂度"""
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.reads = 0
+
+    def __getitem__(self, index):
+        self.reads += 1
+        return super().__getitem__(index)
+
+
+def test_swap_pairing_is_near_linear():
+    def hub_block(n):
+        logs = [{"from": f"u{i}", "to": "hub", "value": 1, "token": "A"} for i in range(n)]
+        logs += [{"from": "hub", "to": f"v{i}", "value": 1, "token": "A"} for i in range(n)]
+        return TransferGraph(block({"txH": "h", "receipt": {"transactionIndex": 0, "logs": logs}}))
+
+    reads = []
+    for n in (500, 2000):
+        graph = hub_block(n)
+        graph.token = CountingList(graph.token)
+        graph.value = CountingList(graph.value)
+        extract_swaps(graph, 0, len(graph.src))
+        reads.append(graph.token.reads + graph.value.reads)
+    # 规模扩大 4 倍，线性配对的读取次数也约为 4 倍，逐个扫描待配对边则约为 16 倍
+    assert reads[1] <= reads[0] * 5
@@ -0,0 +1,90 @@
+import io
+import json
+
+import pytest
+
+import pipeline
+from ledger import build_ledger
+from pipeline import TokenBucket, line_hash, load_checkpoint, read_blocks, run_pipeline
+
+
+@pytest.fixture
+def blocks(sample_block):
+    lines = []
+    for number in range(3):
+        block = {**sample_block, "blockNumber": 100 + number}
+        lines.append(json.dumps(block))
+    return lines
+
+
+def read_rows(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_ledger_mode_writes_one_row_per_block(tmp_path, blocks):
+    output = tmp_path / "out.jsonl"
+    stats = run_pipeline(io.StringIO("\n".join(blocks) + "\n"), str(output), mode="ledger")
+    assert stats["blocks"] == 3 and stats["failed"] == 0
+    rows = sorted(read_rows(output), key=lambda row: row["line"])
+    assert [row["line"] for row in rows] == [1, 2, 3]
+    assert [row["input_hash"] for row in rows] == [line_hash(line) for line in blocks]
+    assert rows[0]["result"] == json.loads(json.dumps(build_ledger(json.loads(blocks[0]))))
+
+
+def test_resume_truncates_half_written_row(tmp_path, blocks):
+    output = tmp_path / "out.jsonl"
+    complete = json.dumps({"line": 1, "input_hash": line_hash(blocks[0]), "result": {}}) + "\n"
+    output.write_text(complete + '{"line": 2, "input_ha', encoding="utf-8")
+
+    assert load_checkpoint(str(output)) == {1: line_hash(blocks[0])}
+    assert output.read_text(encoding="utf-8") == complete
+
+    stats = run_pipeline(io.StringIO("\n".join(blocks) + "\n"), str(output), mode="ledger")
+    assert stats["blocks"] == 2
+    assert sorted(row["line"] for row in read_rows(output)) == [1, 2, 3]
+
+
+def test_resume_refuses_modified_input(tmp_path, blocks):
+    output = tmp_path / "out.jsonl"
+    run_pipeline(io.StringIO(blocks[0] + "\n"), str(output), mode="ledger")
+    before = output.read_text(encoding="utf-8")
+
+    changed = io.StringIO("\n".join([blocks[1], blocks[2]]) + "\n")
+    with pytest.raises(ValueError):
+        run_pipeline(changed, str(output), mode="ledger")
+    assert output.read_text(encoding="utf-8") == before
+
+
+def test_read_blocks_skips_done_lines_and_blanks(blocks):
+    stream = io.StringIO(blocks[0] + "\n\n" + blocks[1] + "\n")
+    done = {1: line_hash(blocks[0])}
+    assert [line_no for line_no, _ in read_blocks(stream, done)] == [3]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_paces_requests(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(pipeline.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(pipeline.time, "sleep", clock.sleep)
+
+    bucket = TokenBucket(rate=2.0, capacity=2)
+    times = []
+    for _ in range(6):
+        bucket.acquire()
+        times.append(clock.now)
+
+    # 桶满时前两次立即通过，之后每 1/rate 秒放行一次
+    assert times == pytest.approx([0.0, 0.0, 0.5, 1.0, 1.5, 2.0])
@@ -0,0 +1,121 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from benchmarks.mock_server import compact_reply
+from ledger import build_ledger
+from mev import detect_mev
+
+
+@pytest.fixture
+def upstream(monkeypatch, tmp_path):
+    """替换模型流式接口：按紧凑格式给出正确答案，并记录每次调用"""
+    monkeypatch.setenv("DEEPSEEK_API_KEY", "test")
+    monkeypatch.setenv("BLOCK_CACHE_DIR", str(tmp_path))
+    state = {"calls": 0, "fail_tx": None, "wait_for_joined": 0}
+
+    async def fake_stream(client, messages, max_tokens=8192):
+        state["calls"] += 1
+        payload = json.loads(messages[-1]["content"])
+        # 等其他相同请求都合并进来，再开始输出
+        for _ in range(500):
+            if server.app.state.coalescer.joined >= state["wait_for_joined"]:
+                break
+            await asyncio.sleep(0.01)
+        if any(tx_index == state["fail_tx"] for tx_index, _ in payload["x"]):
+            raise RuntimeError("upstream failed")
+        reply = json.dumps(compact_reply(payload))
+        for i in range(0, len(reply), 64):
+            yield reply[i:i + 64]
+
+    monkeypatch.setattr(server, "process_stream_async", fake_stream)
+    return state
+
+
+@pytest.fixture
+def client(upstream):
+    with TestClient(server.app) as client:
+        yield client
+
+
+def request(block, **params):
+    return {"block": block, "use_cache": False, **params}
+
+
+def with_value(block, value):
+    block["transactions"][0]["receipt"]["logs"][0]["value"] = value
+    return block
+
+
+@pytest.mark.parametrize("value", ["1e10000000", -1, 2 ** 256, True, "0x" + "f" * 65, "1" * 79])
+def test_rejects_invalid_values(client, upstream, sample_block, value):
+    response = client.post("/analyze", json=request(with_value(sample_block, value)))
+    assert response.status_code == 422
+    assert upstream["calls"] == 0
+
+
+def test_rejects_empty_transactions(client, upstream, sample_block):
+    response = client.post("/analyze", json=request({**sample_block, "transactions": []}))
+    assert response.status_code == 422
+    assert upstream["calls"] == 0
+
+
+def test_accepts_largest_value(client, sample_block):
+    block = with_value(sample_block, str(2 ** 256 - 1))
+    response = client.post("/analyze", json=request(block, mode="ledger", mev=False))
+    assert response.status_code == 200
+
+
+def test_ledger_mode_attaches_mev(client, sample_block):
+    response = client.post("/analyze", json=request(sample_block, mode="ledger"))
+    expected = {**build_ledger(sample_block), "mev": detect_mev(sample_block)}
+    assert response.json() == json.loads(json.dumps(expected))
+
+
+def test_llm_mode_matches_ledger(client, sample_block):
+    response = client.post("/analyze", json=request(sample_block, mev=False))
+    assert response.json() == json.loads(json.dumps(build_ledger(sample_block)))
+
+
+def test_identical_requests_share_one_upstream_run(client, upstream, sample_block):
+    n = 8
+    upstream["wait_for_joined"] = n - 1
+    with ThreadPoolExecutor(max_workers=n) as executor:
+        # 一半请求附加 MEV，另一半不附加，互不影响
+        responses = list(executor.map(
+            lambda i: client.post("/analyze", json=request(sample_block, mev=i % 2 == 0)), range(n)
+        ))
+
+    health = client.get("/health").json()
+    assert health["upstream_started"] == 1
+    assert health["coalesced"] == n - 1
+    assert upstream["calls"] == 1
+    results = [response.json() for response in responses]
+    assert all(("mev" in result) == (i % 2 == 0) for i, result in enumerate(results))
+    assert all(result["addresses"] == results[0]["addresses"] for result in results)
+
+
+def test_failed_batch_keeps_other_batches(client, upstream, sample_block):
+    upstream["fail_tx"] = 1
+    response = client.post("/analyze", json=request(sample_block, batch_size=1, mev=False))
+    assert response.status_code == 200
+    result = response.json()
+    assert len(result["errors"]) == 1
+    assert "upstream failed" in result["errors"][0]["error"]
+
+    remaining = [tx for tx in sample_block["transactions"] if tx["receipt"]["transactionIndex"] != 1]
+    expected = build_ledger({**sample_block, "transactions": remaining})
+    assert result["addresses"] == json.loads(json.dumps(expected["addresses"]))
+
+
+def test_stream_emits_records_before_result(client, sample_block):
+    with client.stream("POST", "/analyze/stream", json=request(sample_block, mev=False)) as response:
+        events = [json.loads(line) for line in response.iter_lines() if line]
+    assert [event["event"] for event in events][-1] == "result"
+    assert sum(event["event"] == "record" for event in events) == sum(
+        len(tokens) for tokens in build_ledger(sample_block)["addresses"].values()
+    )
@@ -0,0 +1,76 @@
+import json
+import random
+
+import pytest
+
+from ledger import build_ledger
+from stream_parser import StreamingRecordParser, recover_addresses
+
+
+def expected_records(ledger):
+    return [
+        {"address": address, "token": token, **entry}
+        for address, tokens in ledger["addresses"].items()
+        for token, entry in tokens.items()
+    ]
+
+
+def feed_in_chunks(text, seed, max_chunk=16):
+    rng = random.Random(seed)
+    parser = StreamingRecordParser()
+    records = []
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, max_chunk)
+        records.extend(parser.feed(text[pos:pos + size]))
+        pos += size
+    return parser, records
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_chunked_parse_matches_whole_output(sample_block, seed):
+    ledger = build_ledger(sample_block)
+    text = "```json\n" + json.dumps(ledger, indent=2) + "\n```"
+    parser, records = feed_in_chunks(text, seed)
+    assert records == expected_records(ledger)
+    assert parser.records == records
+    assert parser.text() == text
+
+
+def test_keys_with_escapes_and_unicode():
+    ledger = {
+        "blockNumber": 1,
+        "addresses": {
+            'a"b\\c': {"t{1}": {"sent": {"total": 1, "steps": []}, "received": {"total": 0, "steps": []}}},
+            "地址é": {"t,2": {"sent": {"total": 0, "steps": []}, "received": {"total": 2, "steps": []}}},
+        },
+    }
+    text = json.dumps(ledger)
+    for seed in range(20):
+        _, records = feed_in_chunks(text, seed, max_chunk=3)
+        assert records == expected_records(ledger)
+
+
+def test_records_are_emitted_as_soon_as_they_close():
+    entry = {"sent": {"total": 5, "steps": []}, "received": {"total": 0, "steps": []}}
+    head = '{"blockNumber": 1, "addresses": {"a": {"t": ' + json.dumps(entry)
+    parser = StreamingRecordParser()
+    assert parser.feed(head[:-1]) == []
+    assert parser.feed(head[-1]) == [{"address": "a", "token": "t", **entry}]
+    assert parser.feed(', "u": {"sent"') == []
+
+
+@pytest.mark.parametrize("fraction", [0.1, 0.35, 0.5, 0.8, 0.99])
+def test_truncated_output_recovers_closed_records(sample_block, fraction):
+    ledger = build_ledger(sample_block)
+    text = json.dumps(ledger)
+    cut = text[:int(len(text) * fraction)]
+    parser = StreamingRecordParser()
+    streamed = parser.feed(cut)
+    recovered = recover_addresses(cut)
+    assert streamed
+    assert sum(len(tokens) for tokens in recovered.values()) == len(streamed)
+    for record in streamed:
+        entry = {k: v for k, v in record.items() if k not in ("address", "token")}
+        assert recovered[record["address"]][record["token"]] == entry
+        assert ledger["addresses"][record["address"]][record["token"]] == entry
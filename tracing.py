@@ -0,0 +1,209 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger("blockchain_analysis.trace")
+
+_current: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+_NULL_STAGE = nullcontext()
+
+
+def tracing_enabled() -> bool:
+    """是否输出追踪日志和指标，由 TRACE_ENABLED 环境变量控制"""
+    return os.getenv("TRACE_ENABLED", "").lower() in ("1", "true", "yes", "on")
+
+
+class Trace:
+    """一次分析的分阶段耗时、首 token 延迟和 token 用量"""
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+        self.stages: Dict[str, float] = {}
+        self.requests: List[dict] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """记录一个阶段的耗时，同名阶段累加"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def add_request(self, **metrics) -> None:
+        """记录一次模型请求的流式指标"""
+        with self._lock:
+            self.requests.append(metrics)
+
+    def summary(self) -> dict:
+        """汇总为可序列化的字典"""
+        end = self.finished if self.finished is not None else time.perf_counter()
+        with self._lock:
+            stages = dict(self.stages)
+            requests = list(self.requests)
+        ttfts = [r["ttft"] for r in requests if r.get("ttft") is not None]
+        chunks = sum(r.get("chunks", 0) for r in requests)
+        stream_seconds = sum(r.get("stream_seconds", 0.0) for r in requests)
+        return {
+            "name": self.name,
+            **self.attrs,
+            "total_seconds": end - self.started,
+            "stages": stages,
+            "requests": len(requests),
+            "ttft_seconds": {
+                "min": min(ttfts) if ttfts else None,
+                "avg": sum(ttfts) / len(ttfts) if ttfts else None,
+                "max": max(ttfts) if ttfts else None,
+                "sum": sum(ttfts),
+                "count": len(ttfts),
+            },
+            "chunks": chunks,
+            "chunks_per_sec": chunks / stream_seconds if stream_seconds else None,
+            "prompt_tokens": sum(r.get("prompt_tokens") or 0 for r in requests),
+            "completion_tokens": sum(r.get("completion_tokens") or 0 for r in requests),
+        }
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def stage(name: str):
+    """在当前追踪中记录阶段耗时；未开启追踪时返回空上下文，开销可以忽略"""
+    trace = _current.get()
+    if trace is None:
+        return _NULL_STAGE
+    return trace.stage(name)
+
+
+@contextmanager
+def start_trace(name: str, force: bool = False, **attrs) -> Iterator[Optional[Trace]]:
+    """开始一次追踪；未开启且未强制时产出 None
+
+    开启 TRACE_ENABLED 时，结束后输出一行 JSON 日志并更新指标。
+    """
+    if not (force or tracing_enabled()):
+        yield None
+        return
+    trace = Trace(name, **attrs)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        trace.finished = time.perf_counter()
+        if tracing_enabled():
+            summary = trace.summary()
+            _ensure_log_handler()
+            logger.info(json.dumps(summary, ensure_ascii=False))
+            metrics.observe(summary)
+
+
+def _ensure_log_handler() -> None:
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+class Metrics:
+    """进程内累计的追踪指标，以 Prometheus 文本格式导出"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_counts: Dict[str, int] = {}
+        self.requests = 0
+        self.ttft_sum = 0.0
+        self.ttft_count = 0
+        self.chunks = 0
+        self.tokens = {"prompt": 0, "completion": 0}
+
+    def observe(self, summary: dict) -> None:
+        with self._lock:
+            self.runs += 1
+            for name, seconds in summary["stages"].items():
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+                self.stage_counts[name] = self.stage_counts.get(name, 0) + 1
+            self.requests += summary["requests"]
+            # 只统计拿到了首 token 的请求
+            self.ttft_sum += summary["ttft_seconds"]["sum"]
+            self.ttft_count += summary["ttft_seconds"]["count"]
+            self.chunks += summary["chunks"]
+            self.tokens["prompt"] += summary["prompt_tokens"]
+            self.tokens["completion"] += summary["completion_tokens"]
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [
+                "# TYPE block_analysis_runs_total counter",
+                f"block_analysis_runs_total {self.runs}",
+                "# TYPE block_analysis_stage_seconds summary",
+            ]
+            for name in sorted(self.stage_seconds):
+                lines.append(f'block_analysis_stage_seconds_sum{{stage="{name}"}} {self.stage_seconds[name]}')
+                lines.append(f'block_analysis_stage_seconds_count{{stage="{name}"}} {self.stage_counts[name]}')
+            lines += [
+                "# TYPE block_analysis_requests_total counter",
+                f"block_analysis_requests_total {self.requests}",
+                "# TYPE block_analysis_ttft_seconds summary",
+                f"block_analysis_ttft_seconds_sum {self.ttft_sum}",
+                f"block_analysis_ttft_seconds_count {self.ttft_count}",
+                "# TYPE block_analysis_chunks_total counter",
+                f"block_analysis_chunks_total {self.chunks}",
+                "# TYPE block_analysis_tokens_total counter",
+            ]
+            for kind, count in self.tokens.items():
+                lines.append(f'block_analysis_tokens_total{{kind="{kind}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """在后台线程中启动 /metrics 文本接口，端口默认读取 TRACE_METRICS_PORT，重复调用只启动一次"""
+    global _metrics_server
+    if port is None:
+        port = int(os.getenv("TRACE_METRICS_PORT") or 0)
+        if not port:
+            return None
+    with _metrics_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            _metrics_server.daemon_threads = True
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    return _metrics_server